@@ -0,0 +1,89 @@
+# Compare pages/sec and peak RSS of the Playwright and HTTP fetch backends against the local stand-in server
+#
+#   python benchmarks/bench_backends.py [--provinces Banten Bali] [--latency 0.05]
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from benchmarks.fixtures import GOOD_DATA_FILES, create_app, start_server
+
+BACKENDS = ('http', 'playwright')
+
+
+async def run_child(backend, base_url, provinces, concurrency):
+    # Point the scraper at the stand-in server and drop the politeness spacing
+    main.BASE_URL = base_url
+    politeness = main.HostPoliteness(max_in_flight=concurrency, min_interval=0)
+
+    start = time.perf_counter()
+    results = await main.scrape_provinces(provinces, max_concurrency=len(provinces),
+                                          politeness=politeness, backend=backend)
+    elapsed = time.perf_counter() - start
+
+    errors = {name: result['error'] for name, result in results.items() if result['error']}
+    pages = sum(len(result['pages']) for result in results.values())
+    rows = sum(len(result['rows']) for result in results.values())
+    return {
+        'backend': backend,
+        'pages': pages,
+        'rows': rows,
+        'seconds': round(elapsed, 3),
+        'pages_per_sec': round(pages / elapsed, 2) if elapsed else None,
+        # ru_maxrss is KiB on Linux; children covers the Playwright driver and Chromium
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'max_child_rss_mb': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        'errors': errors,
+    }
+
+
+async def run_benchmark(args):
+    runner, base_url = await start_server(create_app(args.provinces, latency=args.latency))
+    try:
+        reports = []
+        for backend in args.backends:
+            # Each backend runs in its own process so peak RSS is not shared
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, os.path.abspath(__file__), '--child', backend, '--base-url', base_url,
+                '--concurrency', str(args.concurrency), '--provinces', *args.provinces,
+                stdout=subprocess.PIPE)
+            stdout, _ = await proc.communicate()
+            if proc.returncode != 0:
+                reports.append({'backend': backend, 'error': f"exited with {proc.returncode}"})
+                continue
+            reports.append(json.loads(stdout.decode().strip().splitlines()[-1]))
+        return reports
+    finally:
+        await runner.cleanup()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--provinces', nargs='+', default=list(GOOD_DATA_FILES))
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument('--latency', type=float, default=0.0, help="simulated server latency in seconds")
+    parser.add_argument('--concurrency', type=int, default=4, help="requests in flight per host")
+    parser.add_argument('--child', choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        logging.disable(logging.WARNING)
+        print(json.dumps(asyncio.run(run_child(args.child, args.base_url, args.provinces, args.concurrency))))
+        return
+
+    for report in asyncio.run(run_benchmark(args)):
+        print(json.dumps(report))
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,136 @@
+# Parser golden check and micro-benchmark: legacy per-cell BeautifulSoup parsing vs the lxml table_parser
+#
+#   python benchmarks/bench_parser.py [--repeat 3] [--workers 0 1 2 4]
+#
+# Pages are rendered from the good-data exports; both parsers must reproduce the exported rows
+# (as CompanyRecords) exactly before any timing is reported.
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+
+import main
+from benchmarks.fixtures import GOOD_DATA_FILES, ROWS_PER_PAGE, load_good_data, render_page
+from parse_pool import ParsePool
+from records import CompanyRecord
+from table_parser import parse_rows
+
+
+def legacy_parse_rows(html_content):
+    # scrape_table_data() as it was before table_parser: one full parse plus one re-parse per cell
+    soup = BeautifulSoup(html_content, 'html.parser')
+    table = soup.find('table', {'id': 'newspaper-a'})
+    if not table:
+        return []
+
+    rows = []
+    for row in table.find_all('tr'):
+        is_white_row = (row.get('bgcolor') == 'white' and row.get('valign') == 'top')
+        cells = row.find_all(['td', 'th'])
+        if not cells:
+            continue
+        if is_white_row:
+            all_segments = []
+            for cell in cells:
+                cell_copy = BeautifulSoup(str(cell), 'html.parser').find(['td', 'th'])
+                for br in cell_copy.find_all('br'):
+                    br.replace_with('|||BR_SEPARATOR|||')
+                for segment in cell_copy.get_text().split('|||BR_SEPARATOR|||'):
+                    if segment.strip():
+                        all_segments.append(segment.strip())
+            if len(all_segments) >= 3:
+                reconstructed_row = [all_segments[0], all_segments[1], all_segments[2],
+                                     all_segments[3] if len(all_segments) > 3 else '']
+                phone = ''
+                for segment in all_segments[4:]:
+                    if 'telp' in segment.lower() or 'phone' in segment.lower() or segment.startswith('0') or segment.startswith('+'):
+                        phone = segment
+                        break
+                reconstructed_row.append(phone)
+                reconstructed_row.extend(seg for seg in all_segments[4:] if seg != phone)
+                rows.append(reconstructed_row)
+                continue
+        rows.append([cell.get_text(strip=True) for cell in cells])
+    return rows
+
+
+def render_pages(province):
+    rows = load_good_data(province)
+    prov_token = main.PROVINCES[province]
+    page_count = (len(rows) + ROWS_PER_PAGE - 1) // ROWS_PER_PAGE
+    return rows, [render_page(rows, number, prov_token) for number in range(1, page_count + 1)]
+
+
+def as_records(rows):
+    # Legacy cell lists and exported rows converted to records; header rows drop out
+    records = (row if isinstance(row, CompanyRecord) else CompanyRecord.from_legacy_row(row) for row in rows)
+    return [record for record in records if record is not None]
+
+
+def check_golden(province, expected, parsed):
+    expected = as_records(expected)
+    company_rows = as_records(parsed)
+    if company_rows != expected:
+        mismatch = next(i for i, (a, b) in enumerate(zip(company_rows, expected)) if a != b)
+        raise AssertionError(f"{province}: row {mismatch} differs: {company_rows[mismatch]} != {expected[mismatch]}")
+
+
+def bench(parse, pages, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = sum(len(parse(page)) for page in pages)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return rows, best
+
+
+def bench_pool(pages, workers, repeat):
+    # All pages submitted at once, as concurrent fetchers would; the pool bounds what is in flight
+    async def run():
+        pool = ParsePool(workers).start()
+        try:
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                results = await asyncio.gather(*(pool.parse_page(page) for page in pages))
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            return sum(len(rows) for rows, _ in results), best
+        finally:
+            pool.close()
+    return asyncio.run(run())
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--provinces', nargs='+', default=list(GOOD_DATA_FILES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, nargs='*', default=[],
+                        help="also measure the parser process pool with these worker counts (0 = inline)")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    for province in args.provinces:
+        expected, pages = render_pages(province)
+        for parse in (legacy_parse_rows, parse_rows):
+            check_golden(province, expected, [row for page in pages for row in parse(page)])
+        print(f"{province}: golden output OK ({len(as_records(expected))} rows, {len(pages)} pages)")
+
+        for name, parse in (('legacy', legacy_parse_rows), ('lxml', parse_rows)):
+            rows, elapsed = bench(parse, pages, args.repeat)
+            print(f"  {name:<6} {rows / elapsed:>10,.0f} rows/sec  {len(pages) / elapsed:>8,.0f} pages/sec")
+        for workers in args.workers:
+            rows, elapsed = bench_pool(pages, workers, args.repeat)
+            print(f"  pool={workers:<2} {rows / elapsed:>9,.0f} rows/sec  {len(pages) / elapsed:>8,.0f} pages/sec")
+
+
+if __name__ == '__main__':
+    main_cli()
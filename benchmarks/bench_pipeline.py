@@ -0,0 +1,172 @@
+# End-to-end offline benchmark: scrape_all_pages() -> create_dataframe() -> save, against replayed pages
+#
+#   python benchmarks/bench_pipeline.py [--capture-dir DIR] [--latency 0.05] [--backend http]
+#   python benchmarks/bench_pipeline.py --update-baseline
+#
+# Without --capture-dir the good-data provinces are rendered into a temporary capture first.
+# Each province runs in its own process (so peak RSS is per province); its CSV must equal the
+# good-data export, and throughput is compared with benchmarks/baseline.json.
+
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from benchmarks.fixtures import GOOD_DATA_DIR, GOOD_DATA_FILES, start_server, write_capture
+from benchmarks.replay import create_replay_app, replay_urls
+from metrics import METRICS
+from records import COLUMNS, CompanyRecord
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+TOLERANCE = 0.25  # slower than baseline by more than this share counts as a regression
+
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.reader(f))
+
+
+def good_data_rows(path, province):
+    # The good-data exports use the old Column_1..Column_N layout; convert them the way the journal does
+    records = (CompanyRecord.from_legacy_row(row, province) for row in read_csv(path)[1:])
+    return [list(COLUMNS)] + [['' if value is None else str(value) for value in record.to_row()]
+                              for record in records if record is not None]
+
+
+async def run_child(province, url, backend, output_dir, concurrency):
+    import pandas  # noqa: F401  (main.py loads it lazily; module loading is not part of the timed pipeline)
+
+    politeness = main.HostPoliteness(max_in_flight=concurrency, min_interval=0)
+    METRICS.reset()
+
+    start = time.perf_counter()
+    result = await main.scrape_all_pages(url, backend=backend, politeness=politeness, label=province)
+    scraped = time.perf_counter()
+    rows = main.ResultSet(main.all_data)
+    basename = os.path.join(output_dir, main.excel_sheet_name(province).replace(' ', '_'))
+    main.save_to_csv(f"{basename}.csv", rows)
+    main.save_to_ndjson(f"{basename}.ndjson", rows)
+    main.save_to_excel(f"{basename}.xlsx", rows)
+    elapsed = time.perf_counter() - start
+
+    report = METRICS.report()
+    good_data = GOOD_DATA_FILES.get(province)
+    return {
+        'province': province,
+        'pages': len(result['pages']),
+        'rows': len(rows),
+        'seconds': round(elapsed, 3),
+        'scrape_seconds': round(scraped - start, 3),
+        'export_seconds': round(elapsed - (scraped - start), 3),
+        'pages_per_sec': round(len(result['pages']) / (scraped - start), 2),
+        'rows_per_sec': round(len(rows) / elapsed, 1),
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'stages': {stage: {key: summary[key] for key in ('count', 'total', 'p50', 'p95')}
+                   for stage, summary in report['stages'].items()},
+        'matches_good_data': (read_csv(f"{basename}.csv") == good_data_rows(os.path.join(GOOD_DATA_DIR, good_data),
+                                                                            province)
+                              if good_data else None),
+        'error': result['error'],
+    }
+
+
+def compare_with_baseline(report, baseline, tolerance):
+    reference = baseline.get(report['province'])
+    if not reference:
+        return None
+    ratio = report['seconds'] / reference['seconds'] if reference['seconds'] else None
+    return {'baseline_seconds': reference['seconds'], 'ratio': round(ratio, 3) if ratio else None,
+            'regression': bool(ratio and ratio > 1 + tolerance)}
+
+
+async def run_benchmark(args, capture_dir, output_dir):
+    app = create_replay_app(capture_dir, latency=args.latency)
+    runner, server_url = await start_server(app)
+    try:
+        urls = replay_urls(app, server_url)
+        reports = []
+        for province in args.provinces or list(urls):
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, os.path.abspath(__file__), '--child', province, '--url', urls[province],
+                '--backend', args.backend, '--output-dir', output_dir, '--concurrency', str(args.concurrency),
+                stdout=subprocess.PIPE)
+            stdout, _ = await proc.communicate()
+            if proc.returncode != 0:
+                reports.append({'province': province, 'error': f"exited with {proc.returncode}"})
+                continue
+            reports.append(json.loads(stdout.decode().strip().splitlines()[-1]))
+        return reports
+    finally:
+        await runner.cleanup()
+
+
+def baseline_key(args):
+    return f"{args.backend}@latency={args.latency}"
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--capture-dir', help="pages recorded with main.py --capture (default: rendered from good-data)")
+    parser.add_argument('--provinces', nargs='+', help="provinces to run (default: all in the capture)")
+    parser.add_argument('--backend', default='http', choices=('http', 'playwright'))
+    parser.add_argument('--latency', type=float, default=0.0, help="simulated server latency in seconds")
+    parser.add_argument('--concurrency', type=int, default=4, help="requests in flight per host")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--update-baseline', action='store_true', help="store this run as the new baseline")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    parser.add_argument('--output-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        logging.disable(logging.WARNING)
+        report = asyncio.run(run_child(args.child, args.url, args.backend, args.output_dir, args.concurrency))
+        print(json.dumps(report))
+        return
+
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as workdir:
+        capture_dir = args.capture_dir or write_capture(os.path.join(workdir, 'capture'))
+        output_dir = os.path.join(workdir, 'output')
+        os.makedirs(output_dir)
+        reports = asyncio.run(run_benchmark(args, capture_dir, output_dir))
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baselines = json.load(f)
+    baseline = baselines.get(baseline_key(args), {})
+
+    failed = False
+    for report in reports:
+        if 'seconds' in report:
+            report['baseline'] = compare_with_baseline(report, baseline, args.tolerance)
+        failed |= bool(report.get('error') or report.get('matches_good_data') is False
+                       or (report.get('baseline') or {}).get('regression'))
+        print(json.dumps(report))
+
+    if args.update_baseline:
+        baselines[baseline_key(args)] = {
+            report['province']: {key: report[key] for key in ('pages', 'rows', 'seconds', 'pages_per_sec',
+                                                              'rows_per_sec', 'max_rss_mb')}
+            for report in reports if 'seconds' in report}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, indent=2)
+            f.write('\n')
+        print(f"Baseline saved to {args.baseline}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,96 @@
+# Compare the 'full' and 'lean' Playwright fetch profiles: per-page latency, requests and bytes per page
+#
+#   python benchmarks/bench_profiles.py [--provinces Banten] [--latency 0.05] [--asset-latency 0.2]
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from benchmarks.fixtures import GOOD_DATA_FILES, create_app, start_server
+
+
+async def run_profile(profile, app, base_url, provinces, concurrency):
+    main.BASE_URL = base_url
+    politeness = main.HostPoliteness(max_in_flight=concurrency, min_interval=0)
+    stats = app['stats']
+    for key in stats:
+        stats[key] = 0
+
+    # Time every page load without changing what the crawl does
+    latencies = []
+    load_page = main.load_page
+
+    async def timed_load_page(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await load_page(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    main.load_page = timed_load_page
+    start = time.perf_counter()
+    try:
+        results = await main.scrape_provinces(provinces, max_concurrency=len(provinces), politeness=politeness,
+                                              backend='playwright', profile=profile)
+    finally:
+        main.load_page = load_page
+    elapsed = time.perf_counter() - start
+
+    errors = {name: result['error'] for name, result in results.items() if result['error']}
+    pages = sum(len(result['pages']) for result in results.values())
+    rows = sum(len(result['rows']) for result in results.values())
+    per_page = max(pages, 1)
+    return {
+        'profile': profile,
+        'pages': pages,
+        'rows': rows,
+        'seconds': round(elapsed, 3),
+        'pages_per_sec': round(pages / elapsed, 2) if elapsed else None,
+        'page_latency_p50': round(statistics.median(latencies), 3) if latencies else None,
+        'page_latency_max': round(max(latencies), 3) if latencies else None,
+        'requests_per_page': round((stats['requests'] + stats['asset_requests']) / per_page, 2),
+        'kb_per_page': round((stats['bytes'] + stats['asset_bytes']) / per_page / 1024, 1),
+        'errors': errors,
+    }
+
+
+async def run_benchmark(args):
+    app = create_app(args.provinces, latency=args.latency, asset_latency=args.asset_latency)
+    runner, base_url = await start_server(app)
+    try:
+        reports = []
+        for profile in args.profiles:
+            try:
+                reports.append(await run_profile(profile, app, base_url, args.provinces, args.concurrency))
+            except Exception as e:
+                # Most likely Chromium is not installed (playwright install chromium)
+                reports.append({'profile': profile, 'error': str(e).splitlines()[0]})
+        return reports
+    finally:
+        await runner.cleanup()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--provinces', nargs='+', default=['Bali'], choices=list(GOOD_DATA_FILES))
+    parser.add_argument('--profiles', nargs='+', default=list(main.FETCH_PROFILES), choices=list(main.FETCH_PROFILES))
+    parser.add_argument('--latency', type=float, default=0.0, help="simulated page latency in seconds")
+    parser.add_argument('--asset-latency', type=float, default=0.1, help="simulated latency of css/js/images/fonts")
+    parser.add_argument('--concurrency', type=int, default=2, help="requests in flight per host")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    for report in asyncio.run(run_benchmark(args)):
+        print(json.dumps(report))
+
+
+if __name__ == '__main__':
+    main_cli()
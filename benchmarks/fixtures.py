@@ -0,0 +1,152 @@
+# Local stand-in for the Kemenperin directory, serving pages built from the good-data exports
+
+import asyncio
+import csv
+import html
+import math
+import os
+
+from aiohttp import web
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GOOD_DATA_DIR = os.path.join(REPO_DIR, 'good-data')
+
+# good-data export -> province it was scraped from
+GOOD_DATA_FILES = {
+    'Bali': 'kemenperin_companies_20250801_160523.csv',
+    'DI Yogyakarta': 'kemenperin_companies_20250801_190314.csv',
+    'Banten': 'kemenperin_companies_20250801_201911.csv',
+}
+
+ROWS_PER_PAGE = 20
+PAGINATION_WINDOW = 10
+PAGE_PARAM = 'hal'
+
+# Page assets with roughly realistic sizes, so asset blocking shows up in bandwidth numbers
+STATIC_ASSETS = {
+    'style.css': ('text/css', 60_000),
+    'app.js': ('application/javascript', 180_000),
+    'font.woff2': ('font/woff2', 90_000),
+    'logo.png': ('image/png', 120_000),
+    'banner.jpg': ('image/jpeg', 250_000),
+}
+
+
+def load_good_data(province):
+    """Return the company rows (without header rows) of a good-data CSV export."""
+    path = os.path.join(GOOD_DATA_DIR, GOOD_DATA_FILES[province])
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))
+    return [row for row in rows[1:] if row and row[0] != 'No.']
+
+
+def render_row(row):
+    # Mirrors the site: number | name<br>address<br>phone | KBLI
+    number, name, address, phone = row[0], row[1], row[2], row[3]
+    kbli = row[5] if len(row) > 5 else ''
+    lines = [f"<b>{html.escape(name)}</b>", html.escape(address)]
+    if phone:
+        lines.append(html.escape(phone))
+    return (f'<tr bgcolor="white" valign="top"><td>{html.escape(number)}</td>'
+            f'<td>{"<br>".join(lines)}</td><td>{html.escape(kbli)}</td></tr>')
+
+
+def render_page(rows, page_number, prov_token, base_path='direktori-perusahaan'):
+    """Render one directory page with the same table and pagination markup as the site."""
+    total_pages = max(1, math.ceil(len(rows) / ROWS_PER_PAGE))
+    start = (page_number - 1) * ROWS_PER_PAGE
+    body = ''.join(render_row(row) for row in rows[start:start + ROWS_PER_PAGE])
+
+    def link(number, text):
+        return f'<a href="{base_path}?what=&prov={prov_token}&{PAGE_PARAM}={number}">{text}</a>'
+
+    window_start = (page_number - 1) // PAGINATION_WINDOW * PAGINATION_WINDOW + 1
+    window_end = min(window_start + PAGINATION_WINDOW - 1, total_pages)
+    items = []
+    if window_start > 1:
+        items.append(f'<li>{link(window_start - 1, f"{window_start - 1}...")}</li>')
+    for number in range(window_start, window_end + 1):
+        active = ' class="active"' if number == page_number else ''
+        items.append(f'<li{active}>{link(number, number)}</li>')
+    if window_end < total_pages:
+        items.append(f'<li>{link(window_end + 1, f"{window_end + 1}...")}</li>')
+
+    return ('<!DOCTYPE html><html><head><title>Direktori Perusahaan Industri</title>'
+            '<link rel="stylesheet" href="/static/style.css">'
+            '<link rel="preload" href="/static/font.woff2" as="font" crossorigin>'
+            '<script src="/static/app.js"></script></head><body>'
+            '<img src="/static/logo.png"><img src="/static/banner.jpg">'
+            '<table id="newspaper-a"><tr><th>No.</th><th>Perusahaan</th><th>KBLI</th></tr>'
+            f'{body}</table><ul class="pagination">{"".join(items)}</ul>'
+            '</body></html>')
+
+
+def write_capture(directory, provinces=None):
+    """Write the good-data provinces as a capture directory, as `main.py --capture` would record them."""
+    import main
+    from page_capture import PageCapture
+
+    capture = PageCapture(directory, main.BASE_URL)
+    for name in provinces or GOOD_DATA_FILES:
+        rows = load_good_data(name)
+        listing_url = main.province_url(name)
+        for page_number in range(1, max(1, math.ceil(len(rows) / ROWS_PER_PAGE)) + 1):
+            url = listing_url if page_number == 1 else f"{listing_url}&{PAGE_PARAM}={page_number}"
+            capture.record_page(name, listing_url, page_number, url,
+                                render_page(rows, page_number, main.PROVINCES[name]))
+    capture.close()
+    return directory
+
+
+def create_app(provinces=None, latency=0.0, compress=True, asset_latency=None):
+    """aiohttp app serving /direktori-perusahaan?prov=<province token>&hal=<page> and its assets.
+
+    app['stats'] counts requests and body bytes served, split into documents and assets.
+    """
+    import main
+
+    datasets = {main.PROVINCES[name].replace('%2C', ','): load_good_data(name)
+                for name in (provinces or GOOD_DATA_FILES)}
+    stats = {'requests': 0, 'bytes': 0, 'asset_requests': 0, 'asset_bytes': 0}
+    asset_latency = latency if asset_latency is None else asset_latency
+
+    async def directory(request):
+        rows = datasets.get(request.query.get('prov', ''))
+        if rows is None:
+            raise web.HTTPNotFound()
+        if latency:
+            await asyncio.sleep(latency)
+        prov_token = request.query['prov'].replace(',', '%2C')
+        body = render_page(rows, int(request.query.get(PAGE_PARAM, '1')), prov_token)
+        stats['requests'] += 1
+        stats['bytes'] += len(body)
+        response = web.Response(text=body, content_type='text/html')
+        if compress:
+            response.enable_compression()
+        return response
+
+    async def static(request):
+        if request.match_info['name'] not in STATIC_ASSETS:
+            raise web.HTTPNotFound()
+        content_type, size = STATIC_ASSETS[request.match_info['name']]
+        if asset_latency:
+            await asyncio.sleep(asset_latency)
+        stats['asset_requests'] += 1
+        stats['asset_bytes'] += size
+        return web.Response(body=os.urandom(size), content_type=content_type)
+
+    app = web.Application()
+    app['stats'] = stats
+    app.router.add_get('/direktori-perusahaan', directory)
+    app.router.add_get('/static/{name}', static)
+    return app
+
+
+async def start_server(app, host='127.0.0.1', port=0):
+    """Start `app` and return (runner, base_url)."""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{port}/direktori-perusahaan"
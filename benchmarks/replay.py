@@ -0,0 +1,102 @@
+# Replay server for pages recorded with `main.py --capture DIR`, serving them with their own pagination links
+#
+#   python benchmarks/replay.py CAPTURE_DIR [--port 8080] [--latency 0.05]
+
+import argparse
+import asyncio
+import os
+import re
+import sys
+from urllib.parse import parse_qsl, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web
+
+from benchmarks.fixtures import start_server
+from page_capture import load_manifest
+
+
+def query_key(query_pairs):
+    # Pages are looked up by their query parameters, independent of order and encoding
+    return tuple(sorted(query_pairs))
+
+
+def create_replay_app(directory, latency=0.0, compress=True):
+    """aiohttp app serving every captured page at the path and query it was fetched from.
+
+    Absolute links back to the captured site are made host-relative, so following the
+    pagination stays on the replay server. app['stats'] counts requests, bytes and misses.
+    """
+    manifest = load_manifest(directory)
+    base = urlsplit(manifest.get('base_url') or '')
+    origin = re.compile(rf"(?:https?:)?//{re.escape(base.netloc)}") if base.netloc else None
+
+    pages = {}
+    for listing in manifest['listings'].values():
+        for entry in listing['pages'].values():
+            url = urlsplit(entry['url'])
+            pages[(url.path, query_key(parse_qsl(url.query, keep_blank_values=True)))] = \
+                os.path.join(directory, entry['file'])
+    stats = {'requests': 0, 'bytes': 0, 'misses': 0}
+
+    async def replay(request):
+        path = pages.get((request.path, query_key(request.query.items())))
+        if path is None:
+            stats['misses'] += 1
+            raise web.HTTPNotFound()
+        if latency:
+            await asyncio.sleep(latency)
+        with open(path, encoding='utf-8') as f:
+            body = f.read()
+        if origin:
+            body = origin.sub('', body)
+        stats['requests'] += 1
+        stats['bytes'] += len(body)
+        response = web.Response(text=body, content_type='text/html')
+        if compress:
+            response.enable_compression()
+        return response
+
+    app = web.Application()
+    app['stats'] = stats
+    app['manifest'] = manifest
+    app.router.add_get('/{tail:.*}', replay)
+    return app
+
+
+def replay_urls(app, server_url):
+    """{province: listing URL on the replay server} for a started replay app."""
+    server = urlsplit(server_url)
+    urls = {}
+    for province, listing in app['manifest']['listings'].items():
+        url = urlsplit(listing['url'])
+        urls[province] = url._replace(scheme=server.scheme, netloc=server.netloc).geturl()
+    return urls
+
+
+async def serve(args):
+    app = create_replay_app(args.directory, latency=args.latency)
+    runner, base_url = await start_server(app, port=args.port)
+    for province, url in replay_urls(app, base_url).items():
+        print(f"{province}: {url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('directory', help="capture directory written by main.py --capture")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help="simulated server latency in seconds")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,196 @@
+# Content-hash index for incremental runs: unchanged pages skip parsing, changed companies go to a delta file
+
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+from datetime import datetime
+
+from records import COLUMNS, CompanyRecord, is_record_row
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = 'change_index.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    listing TEXT NOT NULL,
+    page_number INTEGER NOT NULL,
+    table_digest TEXT NOT NULL,
+    last_page INTEGER,
+    rows_json TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (listing, page_number)
+);
+CREATE TABLE IF NOT EXISTS companies (
+    listing TEXT NOT NULL,
+    company_key TEXT NOT NULL,
+    row_digest TEXT NOT NULL,
+    row_json TEXT NOT NULL,
+    PRIMARY KEY (listing, company_key)
+);
+"""
+
+INDEXED_TABLES = ('pages', 'companies')
+
+TABLE_START_PATTERN = re.compile(r'''<table[^>]*\bid\s*=\s*["']?newspaper-a\b''', re.IGNORECASE)
+
+
+def digest(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def table_digest(html):
+    """Digest of the #newspaper-a table markup, found by string search instead of parsing."""
+    match = TABLE_START_PATTERN.search(html or '')
+    if not match:
+        return None
+    end = html.find('</table>', match.start())
+    return digest(html[match.start():end if end != -1 else len(html)])
+
+
+def company_key(record):
+    """Identity of a listing within a province: whitespace-collapsed, case-folded name and address plus KBLI.
+
+    Companies with several KBLI codes are listed once per code, so the code is part of the key.
+    """
+    name = ' '.join(record.full_name.split()).casefold()
+    address = ' '.join(record.address.split()).casefold()
+    return digest(f"{name}\x1f{address}\x1f{record.kbli or ''}")
+
+
+def row_digest(record):
+    # The listing number shifts whenever companies are inserted, so it is not part of the content
+    row = record.to_row()
+    return digest('\x1f'.join('' if value is None else str(value) for value in row[1:-1]))
+
+
+def stored_row(record):
+    return json.dumps(record.to_row(), ensure_ascii=False)
+
+
+class ChangeIndex:
+    """Page and company digests from the previous run, keyed by listing URL.
+
+    The URL carries the search term as well as the province, so runs with different
+    `--what` terms don't compare against each other's companies.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        with self.conn:
+            # Indexes written before listings were keyed by URL used the province name
+            for table in INDEXED_TABLES:
+                columns = [row[1] for row in self.conn.execute(f'PRAGMA table_info({table})')]
+                if 'province' in columns:
+                    self.conn.execute(f'ALTER TABLE {table} RENAME COLUMN province TO listing')
+        self.conn.executescript(SCHEMA)
+
+    def adopt_province(self, province, listing):
+        """Move entries indexed under the province name (older indexes) to `listing`."""
+        with self.conn:
+            for table in INDEXED_TABLES:
+                self.conn.execute(f'UPDATE OR IGNORE {table} SET listing = ? WHERE listing = ?', (listing, province))
+                self.conn.execute(f'DELETE FROM {table} WHERE listing = ?', (province,))
+
+    def unchanged_page(self, listing, page_number, table_hash, province=None):
+        """Return (records, last_page) stored for a page whose table digest is unchanged, else None."""
+        if table_hash is None:
+            return None
+        row = self.conn.execute(
+            'SELECT rows_json, last_page FROM pages WHERE listing = ? AND page_number = ? AND table_digest = ?',
+            (listing, page_number, table_hash)).fetchone()
+        if not row:
+            return None
+        records = (CompanyRecord.from_row(stored, province) for stored in json.loads(row[0]))
+        return [record for record in records if record is not None], row[1]
+
+    def record_page(self, listing, page_number, table_hash, records, last_page=None):
+        if table_hash is None:
+            return
+        rows = [record.to_row() for record in records]
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO pages (listing, page_number, table_digest, last_page, rows_json, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (listing, page_number, table_hash, last_page, json.dumps(rows, ensure_ascii=False),
+                 datetime.now().isoformat()))
+
+    def companies(self, listing, province=None):
+        """{company_key: (row_digest, row_json)} from the previous run.
+
+        Companies indexed before rows were typed are re-keyed from their stored cells, so
+        the first run after the upgrade doesn't report every company as changed.
+        """
+        cursor = self.conn.execute('SELECT company_key, row_digest, row_json FROM companies WHERE listing = ?',
+                                   (listing,))
+        companies = {}
+        for key, row_hash, row_json in cursor:
+            row = json.loads(row_json)
+            if not is_record_row(row):
+                record = CompanyRecord.from_legacy_row(row, province)
+                if record is None:
+                    continue
+                key, row_hash, row_json = company_key(record), row_digest(record), stored_row(record)
+            companies[key] = (row_hash, row_json)
+        return companies
+
+    def replace_companies(self, listing, companies):
+        with self.conn:
+            self.conn.execute('DELETE FROM companies WHERE listing = ?', (listing,))
+            self.conn.executemany(
+                'INSERT INTO companies (listing, company_key, row_digest, row_json) VALUES (?, ?, ?, ?)',
+                ((listing, key, row_hash, row_json) for key, (row_hash, row_json) in companies.items()))
+
+    def close(self):
+        self.conn.close()
+
+
+class ChangeTracker:
+    """Pipeline sink that collects this run's companies and writes the delta against the index."""
+
+    def __init__(self, index):
+        self.index = index
+        self._current = {}
+
+    def write(self, record, province=None):
+        self._current.setdefault(province, {})[company_key(record)] = (row_digest(record), stored_row(record))
+
+    def close(self):
+        pass
+
+    def finish(self, filename, complete_listings):
+        """Write added/removed/changed companies to `filename` (NDJSON) and update the index.
+
+        `complete_listings` maps each fully crawled province to its listing URL. Only provinces
+        crawled without failed pages (and without a page range) are compared; a partial crawl
+        would report every company on a missing page as removed.
+        """
+        counts = {'added': 0, 'removed': 0, 'changed': 0}
+        with open(filename, 'w', encoding='utf-8') as f:
+            def emit(change, province, row_json, previous_json=None):
+                record = {'change': change, 'province': province, 'row': dict(zip(COLUMNS, json.loads(row_json)))}
+                if previous_json is not None:
+                    record['previous'] = dict(zip(COLUMNS, json.loads(previous_json)))
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                counts[change] += 1
+
+            for province, listing in complete_listings.items():
+                current = self._current.get(province, {})
+                previous = self.index.companies(listing, province)
+                for key, (row_hash, row_json) in current.items():
+                    if key not in previous:
+                        emit('added', province, row_json)
+                    elif previous[key][0] != row_hash:
+                        emit('changed', province, row_json, previous[key][1])
+                for key, (_, row_json) in previous.items():
+                    if key not in current:
+                        emit('removed', province, row_json)
+                self.index.replace_companies(listing, current)
+
+        logger.info(f"Delta saved to {filename} ({counts['added']} added, {counts['removed']} removed, "
+                    f"{counts['changed']} changed)")
+        return counts
@@ -0,0 +1,203 @@
+# Persistent company index across runs: one row per company under a normalized key, queryable by KBLI and region
+#
+#   python company_index.py query --kbli 28199 --province "Jawa Barat"
+#   python company_index.py import good-data/kemenperin_companies_20250801_201911.csv --province Banten
+
+import argparse
+import json
+import logging
+import re
+import sqlite3
+import sys
+from datetime import datetime
+
+from records import COLUMNS, CompanyRecord, read_csv_records
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COMPANY_INDEX_PATH = 'company_index.sqlite'
+UPSERT_BATCH_ROWS = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS companies (
+    company_key TEXT PRIMARY KEY,
+    number INTEGER,
+    legal_form TEXT NOT NULL,
+    name TEXT NOT NULL,
+    address TEXT NOT NULL,
+    regency TEXT NOT NULL,
+    address_province TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    kbli INTEGER,
+    province TEXT,
+    region TEXT NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    runs INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS companies_kbli ON companies (kbli, province);
+CREATE INDEX IF NOT EXISTS companies_province ON companies (province, region);
+CREATE INDEX IF NOT EXISTS companies_region ON companies (region, kbli);
+"""
+
+UPSERT = """
+INSERT INTO companies (company_key, number, legal_form, name, address, regency, address_province, phone, kbli,
+                       province, region, first_seen, last_seen)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (company_key) DO UPDATE SET
+    number = excluded.number, legal_form = excluded.legal_form, name = excluded.name, address = excluded.address,
+    regency = excluded.regency, address_province = excluded.address_province, phone = excluded.phone,
+    province = excluded.province, region = excluded.region,
+    runs = runs + (last_seen != excluded.last_seen),
+    last_seen = excluded.last_seen
+"""
+
+REGENCY_PREFIX_PATTERN = re.compile(r'^(?:kabupaten|kab\.?)\s+')
+
+
+def normalize_region(regency):
+    # "Kab. Klungkung", "KABUPATEN  Klungkung" -> "kabupaten klungkung"; "Kota Serang" stays a city
+    region = ' '.join(regency.split()).casefold()
+    return REGENCY_PREFIX_PATTERN.sub('kabupaten ', region)
+
+
+def company_key(record):
+    """Normalized identity of a company across provinces and runs.
+
+    Legal form, whitespace-collapsed case-folded name, KBLI and regency/city: "CV  Adimas" and
+    "CV Adimas" in the same city are one company, the listing number and phone are not part of it.
+    """
+    name = ' '.join(record.name.split()).casefold()
+    return f"{record.legal_form}\x1f{name}\x1f{record.kbli or ''}\x1f{normalize_region(record.regency)}"
+
+
+class CompanyIndex:
+    """SQLite table of every company seen, upserted on its normalized key.
+
+    The latest listing wins for the stored fields; first_seen/last_seen are run timestamps
+    and `runs` counts the runs a company was seen in. It is also a pipeline sink: upserts
+    are batched and committed every UPSERT_BATCH_ROWS and on close().
+    """
+
+    def __init__(self, path=DEFAULT_COMPANY_INDEX_PATH, run_id=None):
+        self.path = path
+        self.run_id = run_id or datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self.upserted = 0
+        self._pending = []
+
+    def upsert(self, record):
+        self._pending.append((company_key(record), *record.to_row(), normalize_region(record.regency), self.run_id,
+                              self.run_id))
+        if len(self._pending) >= UPSERT_BATCH_ROWS:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        with self.conn:
+            self.conn.executemany(UPSERT, self._pending)
+        self.upserted += len(self._pending)
+        self._pending = []
+
+    def write(self, record, province=None):
+        self.upsert(record)
+
+    def get(self, record):
+        """The indexed version of `record`'s company, or None."""
+        self.flush()
+        row = self.conn.execute(f"SELECT {', '.join(COLUMNS)} FROM companies WHERE company_key = ?",
+                                (company_key(record),)).fetchone()
+        return CompanyRecord(*row) if row else None
+
+    def find(self, kbli=None, province=None, regency=None, name=None, limit=None):
+        """Companies matching every given filter, as CompanyRecords.
+
+        Every combination of `kbli`, `province` and `regency` is served by an index; `regency`
+        matches "Kab. X" and "Kabupaten X" alike, `name` is a case-insensitive substring.
+        """
+        self.flush()
+        clauses, params = [], []
+        if kbli is not None:
+            clauses.append('kbli = ?')
+            params.append(int(kbli))
+        if province is not None:
+            clauses.append('province = ?')
+            params.append(province)
+        if regency is not None:
+            clauses.append('region = ?')
+            params.append(normalize_region(regency))
+        if name is not None:
+            clauses.append("name LIKE ? ESCAPE '\\'")
+            params.append('%' + re.sub(r'([%_\\])', r'\\\1', name) + '%')
+        query = f"SELECT {', '.join(COLUMNS)} FROM companies"
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        query += ' ORDER BY province, kbli, name'
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        return [CompanyRecord(*row) for row in self.conn.execute(query, params)]
+
+    def summary(self):
+        cursor = self.conn.execute(
+            'SELECT province, COUNT(*), COUNT(DISTINCT kbli), MAX(last_seen) FROM companies '
+            'GROUP BY province ORDER BY province')
+        return [{'province': province, 'companies': companies, 'kbli_codes': codes, 'last_seen': last_seen}
+                for province, companies, codes, last_seen in cursor]
+
+    def close(self):
+        self.flush()
+        if self.upserted:
+            logger.info(f"Company index {self.path}: {self.upserted} listings upserted")
+        self.conn.close()
+
+
+def import_csv(index, path, province=None):
+    """Upsert an earlier CSV export, in the current layout or the old Column_1..Column_N one."""
+    count = 0
+    for record in read_csv_records(path, province):
+        index.upsert(record)
+        count += 1
+    index.flush()
+    logger.info(f"Imported {count} companies from {path}")
+    return count
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Query or fill the cross-run company index")
+    parser.add_argument('--index', default=DEFAULT_COMPANY_INDEX_PATH, help="company index path (SQLite)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    query = commands.add_parser('query', help="print matching companies as NDJSON")
+    query.add_argument('--kbli', type=int)
+    query.add_argument('--province')
+    query.add_argument('--regency')
+    query.add_argument('--name', help="case-insensitive substring of the company name")
+    query.add_argument('--limit', type=int)
+    importer = commands.add_parser('import', help="add earlier CSV exports to the index")
+    importer.add_argument('files', nargs='+')
+    importer.add_argument('--province', help="province of rows without one (old exports)")
+    commands.add_parser('summary', help="companies per province")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    index = CompanyIndex(args.index)
+    try:
+        if args.command == 'query':
+            for record in index.find(args.kbli, args.province, args.regency, args.name, args.limit):
+                sys.stdout.write(json.dumps(record.to_dict(), ensure_ascii=False) + '\n')
+        elif args.command == 'import':
+            for path in args.files:
+                import_csv(index, path, args.province)
+        else:
+            for entry in index.summary():
+                print(f"{entry['province']}: {entry['companies']} companies, {entry['kbli_codes']} KBLI codes "
+                      f"(last seen {entry['last_seen']})")
+    finally:
+        index.close()
+
+
+if __name__ == '__main__':
+    main_cli()
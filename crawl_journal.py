@@ -0,0 +1,115 @@
+# Durable crawl journal: every completed page and its rows is committed to SQLite so a run can resume
+
+import json
+import logging
+import sqlite3
+from datetime import datetime
+
+from records import CompanyRecord
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOURNAL_PATH = 'crawl_journal.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    url TEXT PRIMARY KEY,
+    province TEXT NOT NULL,
+    completed_at TEXT
+);
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT NOT NULL,
+    page_number INTEGER NOT NULL,
+    row_count INTEGER NOT NULL,
+    rows_json TEXT NOT NULL,
+    last_page INTEGER,
+    completed_at TEXT NOT NULL,
+    PRIMARY KEY (url, page_number)
+);
+"""
+
+
+class CrawlJournal:
+    """Per-listing record of finished pages.
+
+    A listing is one directory URL (province + search term). Each page is written in
+    its own transaction together with its rows, so a crash or Ctrl-C loses at most the
+    pages that were in flight.
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(pages)')}
+        if 'last_page' not in columns:
+            # Journals from before the frontier was kept
+            with self.conn:
+                self.conn.execute('ALTER TABLE pages ADD COLUMN last_page INTEGER')
+
+    def start_listing(self, url, province):
+        with self.conn:
+            self.conn.execute('INSERT OR IGNORE INTO listings (url, province) VALUES (?, ?)', (url, province))
+
+    def reset(self, url=None):
+        """Forget finished pages, for one listing or the whole journal."""
+        with self.conn:
+            if url is None:
+                self.conn.execute('DELETE FROM pages')
+                self.conn.execute('DELETE FROM listings')
+            else:
+                self.conn.execute('DELETE FROM pages WHERE url = ?', (url,))
+                self.conn.execute('DELETE FROM listings WHERE url = ?', (url,))
+
+    def record_page(self, url, page_number, records, last_page=None):
+        """Commit a finished page; `last_page` is the highest page its pagination links to."""
+        rows = [record.to_row() for record in records]
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO pages (url, page_number, row_count, rows_json, last_page, completed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (url, page_number, len(rows), json.dumps(rows, ensure_ascii=False), last_page,
+                 datetime.now().isoformat()))
+
+    def last_known_page(self, url):
+        """Highest page the journaled pages link to, so a resumed crawl plans past them.
+
+        Pages journaled without their pagination count as linking to the page after them.
+        """
+        row = self.conn.execute('SELECT MAX(COALESCE(last_page, page_number + 1)) FROM pages WHERE url = ?',
+                                (url,)).fetchone()
+        return row[0] or 0
+
+    def completed_pages(self, url):
+        """Return {page_number: records} for every finished page of a listing.
+
+        Journals written before rows were typed store the raw cell lists; they are converted here.
+        """
+        listing = self.conn.execute('SELECT province FROM listings WHERE url = ?', (url,)).fetchone()
+        province = listing[0] if listing else None
+        cursor = self.conn.execute('SELECT page_number, rows_json FROM pages WHERE url = ? ORDER BY page_number', (url,))
+        pages = {}
+        for page_number, rows_json in cursor:
+            records = (CompanyRecord.from_row(row, province) for row in json.loads(rows_json))
+            pages[page_number] = [record for record in records if record is not None]
+        return pages
+
+    def mark_complete(self, url):
+        with self.conn:
+            self.conn.execute('UPDATE listings SET completed_at = ? WHERE url = ?', (datetime.now().isoformat(), url))
+
+    def is_complete(self, url):
+        row = self.conn.execute('SELECT completed_at FROM listings WHERE url = ?', (url,)).fetchone()
+        return bool(row and row[0])
+
+    def summary(self):
+        cursor = self.conn.execute(
+            'SELECT l.province, l.completed_at, COUNT(p.page_number), COALESCE(SUM(p.row_count), 0) '
+            'FROM listings l LEFT JOIN pages p ON p.url = l.url GROUP BY l.url ORDER BY l.province')
+        return [{'province': province, 'complete': bool(completed_at), 'pages': pages, 'rows': rows}
+                for province, completed_at, pages, rows in cursor]
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,313 @@
+# Distributed crawl: a coordinator plans the province x page frontier into a shared queue, workers lease and
+# scrape pages, and a merge step writes the same outputs a single-node run would
+#
+#   python distributed.py plan --queue crawl_queue.sqlite --provinces Banten Bali
+#   python distributed.py work --queue crawl_queue.sqlite      # on every node, as many times as wanted
+#   python distributed.py status --queue crawl_queue.sqlite
+#   python distributed.py merge --queue crawl_queue.sqlite --formats csv ndjson xlsx
+
+import argparse
+import asyncio
+import logging
+import os
+import socket
+
+from datetime import datetime
+
+import main
+from main import (FETCH_BACKEND, FETCH_PROFILE, FETCH_PROFILES, MAX_CONCURRENCY, MAX_PAGES, OUTPUT_FORMATS,
+                  PAGE_CONCURRENCY, HostPoliteness, browser_contexts, last_known_page, learn_page_url_pattern,
+                  load_page, non_negative_float, page_html, page_url, parse_html_page, positive_float, positive_int,
+                  province_url, scrape_province)
+from metrics import METRICS
+from page_pool import RECYCLE_NAVIGATIONS, RECYCLE_RSS_MB, PagePool
+from sinks import DATASET_FORMATS, STREAM_SINKS
+from work_queue import DEFAULT_QUEUE_PATH, LEASE_SECONDS, WALK_PAGE, WorkQueue
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 5.0  # seconds between queue checks while other workers still hold leases
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+async def plan_province(new_context, queue, province, what, politeness, profile, max_pages):
+    # Load the first page once to learn the page URL pattern; its rows are stored with the plan
+    url = province_url(province, what)
+    context = await new_context()
+    try:
+        page = await context.new_page()
+        await load_page(page, url, politeness, profile=profile)
+        records, pagination_info = await parse_html_page(await page_html(page), None, province)
+        METRICS.count('pages')
+    finally:
+        await context.close()
+
+    pattern = learn_page_url_pattern(url, pagination_info)
+    if not pattern:
+        # Pages can't be addressed individually; one worker walks the whole listing
+        logger.info(f"[{province}] Page URL pattern not recognised, queued as one listing task")
+        queue.plan_listing(url, province, None, 0, [(WALK_PAGE, url)])
+        return 1
+
+    last_page = min(last_known_page(url, pattern, pagination_info), max_pages)
+    first_page = pagination_info['current_page']
+    page_urls = [(page_number, page_url(pattern, page_number)) for page_number in range(1, last_page + 1)]
+    queue.plan_listing(url, province, pattern, last_page, page_urls, {first_page: records})
+    logger.info(f"[{province}] Planned {last_page} pages via '{pattern['param']}'")
+    return last_page
+
+
+async def plan(queue, provinces=None, what='', backend=FETCH_BACKEND, politeness=None, profile=FETCH_PROFILE,
+               max_pages=MAX_PAGES, max_concurrency=MAX_CONCURRENCY, headless=True):
+    """Coordinator: queue every page of every province's listing."""
+    provinces = list(provinces or main.PROVINCES)
+    politeness = politeness or HostPoliteness()
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async with browser_contexts(backend, politeness, profile, headless) as new_context:
+        async def planner(province):
+            async with semaphore:
+                try:
+                    return await plan_province(new_context, queue, province, what, politeness, profile, max_pages)
+                except Exception as e:
+                    logger.error(f"[{province}] Planning failed: {e}")
+                    return 0
+
+        planned = await asyncio.gather(*(planner(province) for province in provinces))
+    logger.info(f"Planned {sum(planned)} pages for {len(provinces)} provinces in {queue.path}")
+    return queue.progress()
+
+
+class PageWorker:
+    """Leases pages from the queue and scrapes them with a pool of `page_concurrency` browser pages."""
+
+    def __init__(self, queue, worker_id=None, politeness=None, profile=FETCH_PROFILE, page_concurrency=PAGE_CONCURRENCY,
+                 lease_seconds=LEASE_SECONDS, max_pages=MAX_PAGES, recycle_after=RECYCLE_NAVIGATIONS,
+                 max_rss_mb=RECYCLE_RSS_MB):
+        self.queue = queue
+        self.worker_id = worker_id or default_worker_id()
+        self.politeness = politeness or HostPoliteness()
+        self.profile = profile
+        self.page_concurrency = page_concurrency
+        self.lease_seconds = lease_seconds
+        self.max_pages = max_pages
+        self.recycle_after = recycle_after
+        self.max_rss_mb = max_rss_mb
+        self.stats = {'pages': 0, 'rows': 0, 'failed': 0, 'duplicates': 0}
+        self._listings = {}
+
+    def listing(self, url):
+        if url not in self._listings:
+            self._listings[url] = self.queue.listing(url)
+        return self._listings[url]
+
+    def discover(self, url, pagination_info):
+        # Pages beyond the first page's window show up in later pages' pagination
+        listing = self.listing(url)
+        if not pagination_info or not listing['pattern']:
+            return
+        newest = min(last_known_page(url, listing['pattern'], pagination_info), self.max_pages)
+        if newest > listing['last_page']:
+            page_urls = [(page_number, page_url(listing['pattern'], page_number))
+                         for page_number in range(listing['last_page'] + 1, newest + 1)]
+            self.queue.extend_listing(url, newest, page_urls)
+            logger.info(f"[{listing['province']}] Discovered pages up to {newest}")
+            listing['last_page'] = newest
+
+    async def scrape_page(self, page_pool, task):
+        label = task['province']
+        if task['page_number'] == WALK_PAGE:
+            result = await scrape_province(None, task['url'], self.politeness, label=label, profile=self.profile,
+                                           page_pool=page_pool)
+            if result['error'] or result['failed_pages']:
+                raise RuntimeError(result['error'] or f"failed pages {result['failed_pages']}")
+            return result['rows']
+
+        async with page_pool.page() as page:
+            await load_page(page, task['page_url'], self.politeness, profile=self.profile)
+            html_content = await page_html(page)
+        records, pagination_info = await parse_html_page(html_content, None, label)
+        self.discover(task['url'], pagination_info)
+        return records
+
+    async def keep_leased(self, task):
+        # Renew the lease while the page (or a whole widget walk) is still being scraped
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not self.queue.renew(self.worker_id, task, self.lease_seconds):
+                logger.warning(f"[{task['province']}] Lease on page {task['page_number']} expired and was taken over")
+                return
+
+    async def run_task(self, page_pool, task):
+        label = task['province']
+        heartbeat = asyncio.create_task(self.keep_leased(task))
+        try:
+            records = await self.scrape_page(page_pool, task)
+        except Exception as e:
+            logger.warning(f"[{label}] Page {task['page_number']} failed: {e}")
+            self.queue.fail(self.worker_id, task, e)
+            self.stats['failed'] += 1
+            METRICS.count('pages_failed')
+            return
+        finally:
+            heartbeat.cancel()
+
+        METRICS.count('pages')
+        METRICS.count('rows', len(records))
+        if self.queue.complete(self.worker_id, task, records):
+            self.stats['pages'] += 1
+            self.stats['rows'] += len(records)
+            logger.info(f"[{label}] Page {task['page_number']}: {len(records)} rows")
+        else:
+            # Our lease expired and another worker finished the page first; its result stands
+            self.stats['duplicates'] += 1
+            logger.info(f"[{label}] Page {task['page_number']} was already completed by another worker")
+
+    async def run(self, new_context, wait=True):
+        """Work until the queue is drained; with `wait`, also until other workers' leases are resolved."""
+        page_pool = PagePool(new_context, self.page_concurrency, self.recycle_after, self.max_rss_mb).start()
+        try:
+            while True:
+                tasks = self.queue.lease(self.worker_id, page_pool.size, self.lease_seconds)
+                if not tasks:
+                    if not wait or self.queue.is_finished():
+                        break
+                    await asyncio.sleep(POLL_INTERVAL)
+                    continue
+                await asyncio.gather(*(self.run_task(page_pool, task) for task in tasks))
+        finally:
+            page_pool.log_summary()
+            self.politeness.log_summary()
+            await page_pool.close()
+        logger.info(f"Worker {self.worker_id}: {self.stats['pages']} pages, {self.stats['rows']} rows, "
+                    f"{self.stats['failed']} failed, {self.stats['duplicates']} already done elsewhere")
+        return self.stats
+
+
+async def work(queue, worker_id=None, backend=FETCH_BACKEND, politeness=None, profile=FETCH_PROFILE,
+               page_concurrency=PAGE_CONCURRENCY, lease_seconds=LEASE_SECONDS, max_pages=MAX_PAGES, wait=True,
+               headless=True, recycle_after=RECYCLE_NAVIGATIONS, max_rss_mb=RECYCLE_RSS_MB):
+    """Worker: scrape leased pages until the queue is finished."""
+    politeness = politeness or HostPoliteness()
+    worker = PageWorker(queue, worker_id, politeness, profile, page_concurrency, lease_seconds, max_pages,
+                        recycle_after, max_rss_mb)
+    async with browser_contexts(backend, politeness, profile, headless) as new_context:
+        return await worker.run(new_context, wait)
+
+
+def merge(queue, formats=OUTPUT_FORMATS, output_dir='.', basename=None, analyze=True, xlsx_by_province=False,
+          dataset_dir=None, dataset_format='parquet', company_index_path=None, metrics_path=None, normalize=False):
+    """Write the queued results like main() would: listings in plan order, pages in page order, one dedup."""
+    progress = queue.progress()
+    if progress['pending'] or progress['leased']:
+        logger.warning(f"Queue not finished ({progress['pending']} pending, {progress['leased']} leased pages); "
+                       f"merging what is done")
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    os.makedirs(output_dir, exist_ok=True)
+    basename = os.path.join(output_dir, basename or f"kemenperin_companies_{timestamp}")
+    pipeline, collector = main.open_outputs(basename, formats, analyze, dataset_dir, dataset_format,
+                                            company_index_path, timestamp, normalize=normalize)
+    try:
+        for listing in queue.listings():
+            pages = 0
+            for page_number, records in queue.completed_pages(listing['url']):
+                pipeline.write(records, listing['province'])
+                pages += 1
+            missing = queue.failed_pages(listing['url'])
+            status = f", {len(missing)} pages not done: {missing[:10]}" if missing else ""
+            logger.info(f"[{listing['province']}] {pages} pages merged{status}")
+    finally:
+        pipeline.close()
+
+    main.finish_outputs(pipeline, collector, basename, formats, analyze, xlsx_by_province, metrics_path, normalize)
+    return basename
+
+
+def politeness_from_args(args):
+    return HostPoliteness(max_in_flight=args.max_in_flight, min_interval=1 / args.rate if args.rate else 0,
+                          navigation_timeout=args.navigation_timeout, table_timeout=args.table_timeout)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Distributed crawl: plan, work, status and merge")
+    parser.add_argument('--queue', default=DEFAULT_QUEUE_PATH, help="shared work queue (SQLite)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    fetch = argparse.ArgumentParser(add_help=False)
+    fetch.add_argument('--backend', default=FETCH_BACKEND, choices=('playwright', 'http'))
+    fetch.add_argument('--profile', default=FETCH_PROFILE, choices=sorted(FETCH_PROFILES))
+    fetch.add_argument('--headed', action='store_true', help="show the browser window")
+    fetch.add_argument('--max-in-flight', type=positive_int, default=HostPoliteness().max_in_flight,
+                       help="requests in flight per host from this process")
+    fetch.add_argument('--rate', type=non_negative_float, default=1 / HostPoliteness().min_interval,
+                       help="starting requests/sec per host from this process (0 = unlimited)")
+    fetch.add_argument('--max-pages', type=positive_int, default=MAX_PAGES, help="safety limit on pages per province")
+    fetch.add_argument('--navigation-timeout', type=positive_float, default=HostPoliteness().navigation_timeout,
+                       help="seconds for a page to load before the attempt fails")
+    fetch.add_argument('--table-timeout', type=positive_float, default=HostPoliteness().table_timeout,
+                       help="seconds to wait for the directory table once the page has loaded")
+
+    planner = commands.add_parser('plan', parents=[fetch], help="queue every page of the given provinces")
+    planner.add_argument('--provinces', nargs='+', choices=list(main.PROVINCES), help="default: all")
+    planner.add_argument('--what', default='', help="search term (the directory's what= parameter)")
+    planner.add_argument('--concurrency', type=positive_int, default=MAX_CONCURRENCY, help="provinces planned at once")
+
+    worker = commands.add_parser('work', parents=[fetch], help="scrape leased pages until the queue is done")
+    worker.add_argument('--worker-id', help="default: <hostname>-<pid>")
+    worker.add_argument('--page-concurrency', type=positive_int, default=PAGE_CONCURRENCY, help="pages leased at a time")
+    worker.add_argument('--lease', type=positive_float, default=LEASE_SECONDS,
+                        help="seconds before a page of a stopped worker is re-queued (renewed while it is scraped)")
+    worker.add_argument('--recycle-after', type=positive_int, default=RECYCLE_NAVIGATIONS,
+                        help="navigations before a pooled page is replaced")
+    worker.add_argument('--recycle-rss-mb', type=non_negative_float, default=RECYCLE_RSS_MB, dest='max_rss_mb',
+                        help="recycle pooled pages while the worker and its browser use more memory (0 = off)")
+    worker.add_argument('--no-wait', action='store_false', dest='wait',
+                        help="exit when nothing is pending instead of waiting for other workers' leases")
+
+    commands.add_parser('status', help="progress per province")
+    commands.add_parser('requeue-failed', help="give failed pages another round of attempts")
+
+    merger = commands.add_parser('merge', help="write the outputs from the finished queue")
+    merger.add_argument('--formats', nargs='+', default=list(OUTPUT_FORMATS), choices=sorted(STREAM_SINKS) + ['xlsx'])
+    merger.add_argument('--output-dir', default='.')
+    merger.add_argument('--basename', help="output file name without extension (default: kemenperin_companies_<time>)")
+    merger.add_argument('--no-analysis', action='store_false', dest='analyze')
+    merger.add_argument('--xlsx-by-province', action='store_true')
+    merger.add_argument('--normalize', action='store_true', help="also write <name>.normalized.csv")
+    merger.add_argument('--dataset', metavar='DIR')
+    merger.add_argument('--dataset-format', default='parquet', choices=DATASET_FORMATS)
+    merger.add_argument('--company-index', metavar='PATH')
+    merger.add_argument('--metrics', help="metrics report path")
+    args = parser.parse_args()
+
+    queue = WorkQueue(args.queue)
+    try:
+        if args.command == 'plan':
+            progress = asyncio.run(plan(queue, args.provinces, args.what, args.backend, politeness_from_args(args),
+                                        args.profile, args.max_pages, args.concurrency, not args.headed))
+            print(f"{progress['pending']} pages pending, {progress['done']} done")
+        elif args.command == 'work':
+            asyncio.run(work(queue, args.worker_id, args.backend, politeness_from_args(args), args.profile,
+                             args.page_concurrency, args.lease, args.max_pages, args.wait, not args.headed,
+                             args.recycle_after, args.max_rss_mb))
+        elif args.command == 'status':
+            for entry in queue.summary():
+                print(f"{entry['province']}: {entry['done']}/{entry['pages']} pages done, {entry['failed']} failed "
+                      f"(last page {entry['last_page']})")
+            print(', '.join(f"{count} {state}" for state, count in queue.progress().items()))
+        elif args.command == 'requeue-failed':
+            print(f"{queue.requeue_failed()} pages re-queued")
+        else:
+            METRICS.reset()
+            merge(queue, args.formats, args.output_dir, args.basename, args.analyze, args.xlsx_by_province,
+                  args.dataset, args.dataset_format, args.company_index, args.metrics, args.normalize)
+    finally:
+        queue.close()
+
+
+if __name__ == '__main__':
+    main_cli()
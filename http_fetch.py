@@ -0,0 +1,128 @@
+# Browserless fetch backend for the Kemenperin directory using a pooled aiohttp client
+
+import asyncio
+import logging
+import re
+
+import aiohttp
+
+from throttle import NAVIGATION_TIMEOUT, TABLE_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/124.0 Safari/537.36")
+
+TABLE_PATTERN = re.compile(r'''id\s*=\s*["']?newspaper-a\b''')
+
+
+def create_session(limit=16, limit_per_host=4, timeout=NAVIGATION_TIMEOUT):
+    """Create a keep-alive, compression-enabled client session shared by all workers."""
+    connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host,
+                                     keepalive_timeout=30, ttl_dns_cache=300)
+    headers = {
+        'User-Agent': USER_AGENT,
+        'Accept': 'text/html,application/xhtml+xml',
+        'Accept-Encoding': 'gzip, deflate',
+        'Accept-Language': 'id,en;q=0.8',
+    }
+    return aiohttp.ClientSession(connector=connector, headers=headers,
+                                 timeout=aiohttp.ClientTimeout(total=timeout))
+
+
+def has_table(html):
+    return bool(html) and TABLE_PATTERN.search(html) is not None
+
+
+class PlaywrightFallback:
+    """Lazily started Chromium used only for pages whose static HTML has no table.
+
+    `navigation_timeout` and `table_timeout` are in seconds, as in HostPoliteness.
+    """
+
+    def __init__(self, headless=True, navigation_timeout=NAVIGATION_TIMEOUT, table_timeout=TABLE_TIMEOUT):
+        self.headless = headless
+        self.navigation_timeout = navigation_timeout
+        self.table_timeout = table_timeout
+        self._playwright = None
+        self._browser = None
+        self._page = None
+        self._lock = asyncio.Lock()
+        self.fetches = 0
+
+    async def fetch(self, url, timeout=None):
+        # `timeout` (milliseconds, as passed to goto()) overrides the navigation timeout
+        navigation_timeout = timeout or self.navigation_timeout * 1000
+        async with self._lock:
+            if self._page is None:
+                from playwright.async_api import async_playwright
+                logger.info("Starting Chromium for Playwright fallback")
+                self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(headless=self.headless)
+                self._page = await (await self._browser.new_context()).new_page()
+            await self._page.goto(url, timeout=navigation_timeout)
+            await self._page.wait_for_load_state('networkidle', timeout=navigation_timeout)
+            await self._page.wait_for_selector('#newspaper-a', timeout=self.table_timeout * 1000)
+            self.fetches += 1
+            return await self._page.content()
+
+    async def close(self):
+        if self._browser:
+            await self._browser.close()
+        if self._playwright:
+            await self._playwright.stop()
+        self._playwright = self._browser = self._page = None
+
+
+class HttpPage:
+    """Minimal stand-in for a Playwright page backed by a plain HTTP GET.
+
+    Implements the calls scrape_province() makes (goto, wait_for_load_state,
+    wait_for_selector, content, close) so the crawl logic is backend-agnostic.
+    """
+
+    def __init__(self, context):
+        self.context = context
+        self.url = None
+        self._html = ''
+
+    async def goto(self, url, timeout=None, **kwargs):
+        # `timeout` is in milliseconds, as with Playwright
+        options = {'timeout': aiohttp.ClientTimeout(total=timeout / 1000)} if timeout else {}
+        async with self.context.session.get(url, **options) as response:
+            response.raise_for_status()
+            self._html = await response.text()
+        self.url = url
+        self.context.bytes_fetched += len(self._html)
+        if not has_table(self._html) and self.context.fallback:
+            logger.info(f"Table missing in static HTML, falling back to Playwright: {url}")
+            self._html = await self.context.fallback.fetch(url, timeout)
+
+    async def wait_for_load_state(self, state='load', **kwargs):
+        # Static HTML is complete once the response body has been read
+        return None
+
+    async def wait_for_selector(self, selector, timeout=None, **kwargs):
+        if selector == '#newspaper-a' and not has_table(self._html):
+            raise TimeoutError(f"Selector {selector} not found in {self.url}")
+
+    async def content(self):
+        return self._html
+
+    async def close(self):
+        self._html = ''
+
+
+class HttpContext:
+    """Stand-in for a Playwright browser context sharing one pooled session."""
+
+    def __init__(self, session, fallback=None):
+        self.session = session
+        self.fallback = fallback
+        self.bytes_fetched = 0
+
+    async def new_page(self):
+        return HttpPage(self)
+
+    async def close(self):
+        return None
@@ -1,13 +1,27 @@
-# Kemenperin web scraping using Playwright with BeautifulSoup and pandas
+# Kemenperin web scraping using Playwright with lxml and pandas
+# (pandas, Playwright and the Excel/Parquet writers are imported only by the stages that use them)
 
+import argparse
 import asyncio
+import os
+from contextlib import asynccontextmanager
 from datetime import datetime
-from playwright.async_api import async_playwright
-from bs4 import BeautifulSoup
-import pandas as pd
+from table_parser import parse_page, parse_pagination, parse_rows
+from records import COLUMNS
+from crawl_journal import DEFAULT_JOURNAL_PATH, CrawlJournal
+from sinks import DATASET_FORMATS, STREAM_SINKS, CollectSink, DatasetSink, RowPipeline, open_sinks
+from change_index import DEFAULT_INDEX_PATH, ChangeIndex, ChangeTracker, table_digest
+from company_index import CompanyIndex
+from throttle import (INITIAL_RATE, MAX_RATE, MAX_RETRIES, NAVIGATION_TIMEOUT, PER_HOST_CONCURRENCY, TABLE_TIMEOUT,
+                      HostPoliteness)
+from metrics import METRICS, serve_prometheus
+from page_capture import PageCapture
+from parse_pool import PARSE_WORKERS, ParsePool
+from page_pool import RECYCLE_NAVIGATIONS, RECYCLE_RSS_MB, PagePool
 import logging
 import json
 import re
+from urllib.parse import parse_qsl, quote_plus, urlencode, urljoin, urlsplit, urlunsplit
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -15,110 +29,149 @@ logger = logging.getLogger(__name__)
 
 # Global variable to store all scraped data
 all_data = []
-base_url = "https://kemenperin.go.id/direktori-perusahaan"
-# DKI
-base_url = "https://kemenperin.go.id/direktori-perusahaan?what=&prov=JWlMr9dBZoh4NcRGhLV2lw1ZzJLjyJbE3zQxksmdgRg%2C"
-# Jabar
-base_url = "https://kemenperin.go.id/direktori-perusahaan?what=&prov=g-g92cJf63GcZzFru_hX80HG3NA95zwE5tWTVGAI5xY%2C"
-# Jateng
-base_url = "https://kemenperin.go.id/direktori-perusahaan?what=&prov=JQYaw_F3IWxjLT5vFsXUh6CwfCBsw3zUdgJGGaNtqc0%2C"
-# Jatim
-base_url = "https://kemenperin.go.id/direktori-perusahaan?what=&prov=HJCA4sCEb2EHadmM-d2MTdZLHIqCSlODwIEaR0IZuz0%2C"
-# Bali
-base_url = "https://kemenperin.go.id/direktori-perusahaan?what=&prov=0bCtGgIPKU5sHVP-I3RJR_zaGkICRuxrBuLF8pn6okw%2C"
-# DIY
-base_url = "https://kemenperin.go.id/direktori-perusahaan?what=&prov=YaPZnRqzpP2obO5M2vJBT-05qeMzPo7KQSLLhi4zW28%2C"
-# Banten
-base_url = "https://kemenperin.go.id/direktori-perusahaan?what=&prov=szh3Nx9NmSTOTpqeCuh7rOYNcZov8Oricx3WNJaMJkg%2C"
-
-
-async def get_pagination_info(page):
+
+BASE_URL = "https://kemenperin.go.id/direktori-perusahaan"
+
+# Province registry: name -> value of the `prov` query parameter (already URL-encoded).
+# Add new provinces here; the token can be copied from the directory's province filter.
+PROVINCES = {
+    'DKI Jakarta': 'JWlMr9dBZoh4NcRGhLV2lw1ZzJLjyJbE3zQxksmdgRg%2C',
+    'Jawa Barat': 'g-g92cJf63GcZzFru_hX80HG3NA95zwE5tWTVGAI5xY%2C',
+    'Jawa Tengah': 'JQYaw_F3IWxjLT5vFsXUh6CwfCBsw3zUdgJGGaNtqc0%2C',
+    'Jawa Timur': 'HJCA4sCEb2EHadmM-d2MTdZLHIqCSlODwIEaR0IZuz0%2C',
+    'Bali': '0bCtGgIPKU5sHVP-I3RJR_zaGkICRuxrBuLF8pn6okw%2C',
+    'DI Yogyakarta': 'YaPZnRqzpP2obO5M2vJBT-05qeMzPo7KQSLLhi4zW28%2C',
+    'Banten': 'szh3Nx9NmSTOTpqeCuh7rOYNcZov8Oricx3WNJaMJkg%2C',
+}
+
+DEFAULT_PROVINCE = 'Banten'
+
+# Scheduler defaults
+MAX_CONCURRENCY = 4          # provinces scraped at the same time
+FETCH_PROFILE = 'full'       # Playwright page-load profile, see FETCH_PROFILES
+PAGE_CONCURRENCY = 2         # browser pages per province when page URLs can be planned
+MAX_PAGES = 200000           # safety limit on pages per province
+FETCH_BACKEND = 'playwright'  # 'playwright' or 'http' (browserless, Playwright fallback)
+OUTPUT_FORMATS = ('csv', 'ndjson', 'xlsx')  # any of csv, json, ndjson, parquet, xlsx
+CATEGORY_MAX_RATIO = 0.5     # columns with fewer distinct values than this share of rows become categoricals
+
+
+def province_url(province, what=''):
+    if province not in PROVINCES:
+        raise ValueError(f"Unknown province: {province}. Known: {', '.join(PROVINCES)}")
+    # The search term is user input; the prov tokens are already URL-encoded and kept as they are
+    return f"{BASE_URL}?what={quote_plus(what)}&prov={PROVINCES[province]}"
+
+
+base_url = province_url(DEFAULT_PROVINCE)
+
+# Playwright page-load profiles. 'lean' only lets the top-level HTML document through,
+# trims Chromium features and reads the table as soon as it is in the DOM; 'full' loads
+# the page like a normal browser and waits for the network to go idle.
+FETCH_PROFILES = {
+    'full': {
+        'launch_args': [],
+        'context_options': {},
+        'block_resources': False,
+        'wait_until': 'load',
+        'network_idle': True,
+    },
+    'lean': {
+        'launch_args': [
+            '--disable-gpu',
+            '--disable-extensions',
+            '--disable-background-networking',
+            '--disable-background-timer-throttling',
+            '--disable-component-update',
+            '--disable-default-apps',
+            '--disable-dev-shm-usage',
+            '--disable-sync',
+            '--metrics-recording-only',
+            '--mute-audio',
+            '--no-first-run',
+            '--blink-settings=imagesEnabled=false',
+        ],
+        'context_options': {'service_workers': 'block', 'viewport': {'width': 1024, 'height': 768}},
+        'block_resources': True,
+        'wait_until': 'domcontentloaded',
+        'network_idle': False,
+    },
+}
+
+
+async def allow_documents_only(route):
+    # Abort everything except the main frame's HTML (images, CSS, fonts, scripts, XHR, iframes, ...)
+    request = route.request
     try:
-        # Get the page HTML content
+        is_main_document = request.resource_type == 'document' and request.frame.parent_frame is None
+    except Exception:
+        is_main_document = False
+    if is_main_document:
+        await route.continue_()
+    else:
+        await route.abort()
+
+async def new_browser_context(browser, profile=FETCH_PROFILE):
+    settings = FETCH_PROFILES[profile]
+    context = await browser.new_context(**settings['context_options'])
+    if settings['block_resources']:
+        await context.route('**/*', allow_documents_only)
+    return context
+
+
+class OrderedPageEmitter:
+    """Hands finished pages to `on_rows` in page order even when they complete out of order."""
+
+    def __init__(self, label, on_rows=None, first_page=1):
+        self.label = label
+        self.on_rows = on_rows
+        self.next_page = first_page
+        self._ready = {}
+
+    def done(self, page_number, rows):
+        self._ready[page_number] = rows
+        while self.next_page in self._ready:
+            self._emit(self.next_page, self._ready.pop(self.next_page))
+            self.next_page += 1
+
+    def flush(self):
+        # Emit whatever is left (pages after a failed or missing page)
+        for page_number in sorted(self._ready):
+            self._emit(page_number, self._ready.pop(page_number))
+
+    def _emit(self, page_number, rows):
+        if rows and self.on_rows:
+            self.on_rows(self.label, page_number, rows)
+
+
+async def page_html(page):
+    # page.content() with timing and byte accounting; called once per fetched page
+    with METRICS.timer('content'):
         html_content = await page.content()
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        pagination = soup.find('ul', {'class': 'pagination'})
-        if not pagination:
-            return None
-        
-        pages = []
-        current_page = 1
-        max_visible_page = 1
-        has_more_pages = False
-        
-        # Find all pagination links
-        for li in pagination.find_all('li'):
-            links = li.find_all('a')
-            for link in links:
-                if link:
-                    text = link.get_text(strip=True)
-                    href = link.get('href', '')
-                    is_active = 'active' in li.get('class', [])
-                    
-                    # Extract page number from text that might contain dots
-                    import re
-                    match = re.match(r'^(\d+)', text)
-                    if match:
-                        page_number = int(match.group(1))
-                        if is_active:
-                            current_page = page_number
-                        
-                        # Track the highest visible page number
-                        max_visible_page = max(max_visible_page, page_number)
-                        
-                        # Check if this link has dots (indicating more pages)
-                        if '..' in text:
-                            has_more_pages = True
-                        
-                        pages.append({
-                            'text': text,
-                            'href': href,
-                            'is_active': is_active,
-                            'page_number': page_number,
-                            'has_dots': '..' in text
-                        })
-                    else:
-                        # Text is not a number (e.g., "Next", "Previous")
-                        pages.append({
-                            'text': text,
-                            'href': href,
-                            'is_active': is_active,
-                            'page_number': None,
-                            'has_dots': False
-                        })
-        
-        # Remove duplicates
-        unique_pages = []
-        seen_page_numbers = set()
-        for p in pages:
-            if p['page_number'] is not None:
-                if p['page_number'] not in seen_page_numbers:
-                    unique_pages.append(p)
-                    seen_page_numbers.add(p['page_number'])
-            else:
-                unique_pages.append(p)
-        
-        page_numbers = [p['page_number'] for p in unique_pages if p['page_number'] is not None]
-        
-        logger.info(f"Found page numbers: {sorted(page_numbers) if page_numbers else 'None'}")
-        logger.info(f"Current page: {current_page}, Max visible: {max_visible_page}, Has more: {has_more_pages}")
-        
-        return {
-            'current_page': current_page,
-            'pages': unique_pages,
-            'max_visible_page': max_visible_page,
-            'has_more_pages': has_more_pages,
-            'page_numbers': sorted(page_numbers) if page_numbers else []
-        }
+    METRICS.count('bytes', len(html_content.encode('utf-8')))
+    return html_content
+
+async def parse_html_page(html_content, parse_pool=None, province=None):
+    # Records and pagination in one parse, in the parser processes when a pool is given
+    with METRICS.timer('parse_page'):
+        if parse_pool:
+            return await parse_pool.parse_page(html_content, province)
+        return parse_page(html_content, province)
+
+async def get_pagination_info(page, html_content=None):
+    try:
+        # Get the page HTML content (unless the caller already read it)
+        html_content = html_content or await page_html(page)
+        with METRICS.timer('parse_pagination'):
+            return parse_pagination(html_content)
         
     except Exception as e:
         logger.error(f"Error getting pagination info: {e}")
         return None
 
-async def find_next_page_to_scrape(page):
+async def find_next_page_to_scrape(page, pagination_info=None):
     try:
-        pagination_info = await get_pagination_info(page)
+        pagination_info = pagination_info or await get_pagination_info(page)
         if not pagination_info:
             return None
         
@@ -147,40 +200,111 @@ async def find_next_page_to_scrape(page):
         logger.error(f"Error finding next page: {e}")
         return None
 
-async def navigate_to_page(page, page_number):
+def learn_page_url_pattern(url, pagination_info):
+    """Learn which query parameter selects the page from the pagination hrefs.
+
+    Fits value = scale * page_number + offset over every numbered link carrying the
+    parameter, so both page-number (`hal=3`) and row-offset (`start=40`) styles are
+    recognised, also when the page 1 link has no page parameter at all. At least two
+    links must carry it; returns None when no parameter explains them all.
+    """
+    if not pagination_info:
+        return None
+    
+    samples = []
+    for p in pagination_info['pages']:
+        if p['page_number'] is None or not p['href'] or p['href'].startswith('#'):
+            continue
+        href = urljoin(url, p['href'])
+        samples.append((p['page_number'], href, dict(parse_qsl(urlsplit(href).query, keep_blank_values=True))))
+    if not samples:
+        return None
+    
+    # Candidate parameters from every link, in order of first appearance
+    params = dict.fromkeys(param for _, _, query in samples for param in query)
+    for param in params:
+        # Links without the parameter (often page 1) are skipped, a non-numeric value rules it out
+        carrying = [(page_number, href, query[param]) for page_number, href, query in samples if param in query]
+        if not all(value.isdigit() for _, _, value in carrying):
+            continue
+        distinct = sorted({(page_number, int(value)) for page_number, _, value in carrying})
+        if len(distinct) < 2:
+            continue
+        (n1, v1), (n2, v2) = distinct[0], distinct[-1]
+        if n1 == n2 or (v2 - v1) % (n2 - n1):
+            continue
+        scale = (v2 - v1) // (n2 - n1)
+        offset = v1 - scale * n1
+        if scale > 0 and all(v == scale * n + offset for n, v in distinct):
+            return {'param': param, 'scale': scale, 'offset': offset, 'template': carrying[0][1]}
+    
+    return None
+
+def page_url(pattern, page_number):
+    parts = urlsplit(pattern['template'])
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    value = str(pattern['scale'] * page_number + pattern['offset'])
+    query = [(key, value if key == pattern['param'] else v) for key, v in query]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+def last_known_page(url, pattern, pagination_info):
+    # Highest page reachable from the widget, including "Last"/"»" links whose text is not a number
+    last_page = pagination_info['max_visible_page']
+    for p in pagination_info['pages']:
+        if not p['href'] or p['href'].startswith('#'):
+            continue
+        query = dict(parse_qsl(urlsplit(urljoin(url, p['href'])).query, keep_blank_values=True))
+        value = query.get(pattern['param'], '')
+        if value.isdigit() and (int(value) - pattern['offset']) % pattern['scale'] == 0:
+            last_page = max(last_page, (int(value) - pattern['offset']) // pattern['scale'])
+    return last_page
+
+async def load_page(page, url, politeness=None, profile=FETCH_PROFILE):
+    """Navigate and wait for the directory table within the host's politeness budget.
+
+    Failed attempts are retried with jittered exponential backoff up to the host
+    policy's `max_retries`, each within the policy's navigation and table timeouts;
+    the last error is raised. `profile` picks what the load waits for (see FETCH_PROFILES).
+    """
+    if politeness is None:
+        politeness = HostPoliteness()
+    settings = FETCH_PROFILES[profile]
+    # Playwright takes milliseconds
+    navigation_timeout = politeness.navigation_timeout * 1000
+    table_timeout = politeness.table_timeout * 1000
+    for attempt in range(politeness.max_retries + 1):
+        try:
+            async with politeness.slot(url):
+                METRICS.count('requests')
+                with METRICS.timer('navigation'):
+                    await page.goto(url, timeout=navigation_timeout, wait_until=settings['wait_until'])
+                if settings['network_idle']:
+                    with METRICS.timer('network_idle'):
+                        await page.wait_for_load_state('networkidle', timeout=navigation_timeout)
+                with METRICS.timer('table_wait'):
+                    await page.wait_for_selector('#newspaper-a', state='attached', timeout=table_timeout)
+            return
+        except Exception as e:
+            if attempt == politeness.max_retries:
+                raise
+            delay = politeness.backoff_delay(attempt)
+            politeness.retries += 1
+            METRICS.count('retries')
+            logger.warning(f"Attempt {attempt + 1} for {url} failed ({e}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+async def navigate_to_page(page, page_number, politeness=None, profile=FETCH_PROFILE, pagination_info=None):
+    # `pagination_info` of the page holding the link, when it isn't the one `page` shows
     try:
-        # Get current HTML to find the pagination link
-        html_content = await page.content()
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
         # Find the pagination link for the specific page
-        pagination = soup.find('ul', {'class': 'pagination'})
-        if pagination:
-            for li in pagination.find_all('li'):
-                links = li.find_all('a')
-                for link in links:
-                    if link:
-                        link_text = link.get_text(strip=True)
-                        # Check if the link text starts with the page number
-                        import re
-                        match = re.match(r'^(\d+)', link_text)
-                        if match and int(match.group(1)) == page_number:
-                            # Use the href to navigate directly
-                            href = link.get('href')
-                            if href:
-                                # Convert relative URL to absolute if needed
-                                if href.startswith('/'):
-                                    full_url = f"https://kemenperin.go.id{href}"
-                                elif href.startswith('direktori-perusahaan'):
-                                    full_url = f"https://kemenperin.go.id/{href}"
-                                else:
-                                    full_url = href
-                                
-                                logger.info(f"Navigating to page {page_number} via URL: {full_url}")
-                                await page.goto(full_url)
-                                await page.wait_for_load_state('networkidle')
-                                await page.wait_for_selector('#newspaper-a', timeout=40000)
-                                return True
+        pagination_info = pagination_info or await get_pagination_info(page)
+        for page_info in (pagination_info or {}).get('pages', []):
+            # Use the href to navigate directly
+            if page_info['page_number'] == page_number and page_info['href']:
+                full_url = urljoin(BASE_URL, page_info['href'])
+                logger.info(f"Navigating to page {page_number} via URL: {full_url}")
+                await load_page(page, full_url, politeness, profile=profile)
+                return True
         
         logger.warning(f"Page {page_number} link not found in current pagination")
         return False
@@ -189,338 +313,1017 @@ async def navigate_to_page(page, page_number):
         logger.error(f"Error navigating to page {page_number}: {e}")
         return False
 
-async def scrape_all_pages():
-
-    global all_data
+async def walk_pagination(page_pool, page, url, label, politeness, result, journal=None, emitter=None,
+                          keep_rows=True, profile=FETCH_PROFILE, capture=None, first_page=1, page_limit=MAX_PAGES,
+                          html_content=None):
+    # Fallback: advance one page at a time through the rendered pagination widget. `page` shows the
+    # first page and is leased from `page_pool`; every navigation gets a fresh lease, so the pool can
+    # recycle or replace the page between pages, and the last lease is released here. `html_content`
+    # is the first page's HTML when the caller has already read it.
+    scraped_pages = set()  # Keep track of pages we've already scraped
+    skipped_pages = set()  # Pages before `first_page`, walked through without scraping
+    journaled_pages = journal.completed_pages(url) if journal else {}
+    failed = False
     
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)  # Set to True for production
-        context = await browser.new_context()
-        page = await context.new_page()
-        
-        try:
-            # Navigate to the base URL
-            logger.info(f"Navigating to {base_url}")
-            await page.goto(base_url)
-            await page.wait_for_load_state('networkidle')
+    try:
+        while True:
+            # Read the page once; the pagination, the table and the next link all come from this HTML
+            html_content = html_content or await page_html(page)
+            pagination_info = await get_pagination_info(page, html_content)
+            if not pagination_info:
+                logger.warning(f"[{label}] No pagination info found")
+                break
             
-            # Wait for table to load
-            await page.wait_for_selector('#newspaper-a', timeout=40000)
+            current_page = pagination_info['current_page']
             
-            scraped_pages = set()  # Keep track of pages we've already scraped
+            # Skip if we've already scraped this page
+            if current_page in scraped_pages or current_page in skipped_pages:
+                logger.warning(f"[{label}] Page {current_page} already scraped, stopping to avoid infinite loop")
+                break
             
-            while True:
-                # Get current pagination info
-                pagination_info = await get_pagination_info(page)
-                if not pagination_info:
-                    logger.warning("No pagination info found")
-                    break
-                
-                current_page = pagination_info['current_page']
-                
-                # Skip if we've already scraped this page
-                if current_page in scraped_pages:
-                    logger.warning(f"Page {current_page} already scraped, stopping to avoid infinite loop")
+            # Pages finished in an earlier run still have to be walked through, but not re-parsed
+            if current_page < first_page:
+                logger.info(f"[{label}] Skipping page {current_page} (range starts at {first_page})")
+                skipped_pages.add(current_page)
+                page_data = None
+            elif current_page in journaled_pages:
+                logger.info(f"[{label}] Page {current_page} already in journal")
+                page_data = journaled_pages[current_page]
+                METRICS.count('pages_from_journal')
+            else:
+                logger.info(f"[{label}] Scraping page {current_page}")
+                if capture:
+                    capture.record_page(label, url, current_page, page.url, html_content)
+                page_data = await scrape_table_data(page, label, html_content)
+                METRICS.count('pages')
+                METRICS.count('rows', len(page_data))
+                if page_data and journal:
+                    journal.record_page(url, current_page, page_data)
+            
+            if page_data:
+                if keep_rows:
+                    result['rows'].extend(page_data)
+                if emitter:
+                    emitter.done(current_page, page_data)
+                scraped_pages.add(current_page)
+                logger.info(f"[{label}] Scraped {len(scraped_pages)} pages so far")
+            elif page_data is not None:
+                logger.warning(f"[{label}] No data found on page {current_page}")
+            
+            # Safety break to prevent infinite loops (and the end of a requested page range)
+            if current_page >= page_limit:
+                logger.info(f"[{label}] Reached page limit ({page_limit}), stopping")
+                break
+            
+            # Find next page to scrape
+            next_page = await find_next_page_to_scrape(page, pagination_info)
+            
+            if next_page and next_page not in scraped_pages:
+                logger.info(f"[{label}] Attempting to navigate to page {next_page}")
+                # The link comes from this page's widget; the next page may load on another pooled page
+                await page_pool.release(page)
+                page = html_content = None
+                page = await page_pool.acquire()
+                if not await navigate_to_page(page, next_page, politeness, profile, pagination_info):
+                    logger.warning(f"[{label}] Failed to navigate to page {next_page}")
+                    result['failed_pages'] = [next_page]
+                    failed = True
                     break
+            else:
+                logger.info(f"[{label}] No more new pages to scrape")
+                break
+    except Exception:
+        failed = True
+        raise
+    finally:
+        result['pages'] = sorted(scraped_pages)
+        if page is not None:
+            await page_pool.release(page, failed=failed)
+
+async def fetch_planned_pages(page_pool, url, pattern, pagination_info, label, politeness, page_concurrency,
+                              rows_by_page, failed_pages, journal=None, emitter=None, keep_rows=True,
+                              change_index=None, profile=FETCH_PROFILE, capture=None, parse_pool=None,
+                              first_page=1, page_limit=MAX_PAGES, known_last_page=0):
+    # Fetch every planned page URL with up to `page_concurrency` fetchers, in any order. Fetchers lease
+    # a pooled browser page per navigation and only read the HTML; parsing and bookkeeping happen in
+    # parser tasks fed through a bounded queue, so navigations continue while pages are parsed (in
+    # `parse_pool` if given). `known_last_page` extends the frontier past the first page's window
+    # (pages a resumed crawl already knows of from the journal).
+    last_page = min(max(last_known_page(url, pattern, pagination_info), known_last_page), page_limit)
+    queue = asyncio.Queue()
+    probes = set()  # pages fetched only for their pagination links, to reach a range past the known pages
+    for page_number in range(first_page, last_page + 1):
+        if page_number not in rows_by_page:
+            queue.put_nowait(page_number)
+    if last_page < first_page:
+        probes.add(last_page)
+        queue.put_nowait(last_page)
+        logger.info(f"[{label}] Page {first_page} is past the last known page {last_page}, following the pagination")
+    else:
+        logger.info(f"[{label}] Planned {queue.qsize()} page URLs via '{pattern['param']}' "
+                    f"(last known page {last_page})")
+    parse_queue = asyncio.Queue(maxsize=parse_pool.max_pending if parse_pool else PAGE_CONCURRENCY)
+    
+    def extend_frontier(newest):
+        # Pages beyond the first page's window are discovered as the crawl goes
+        nonlocal last_page
+        newest = min(newest or 0, page_limit)
+        if newest <= last_page:
+            return
+        if newest < first_page:
+            probes.add(newest)
+            queue.put_nowait(newest)
+        else:
+            for extra in range(max(last_page + 1, first_page), newest + 1):
+                queue.put_nowait(extra)
+        last_page = newest
+    
+    def page_failed(page_number, error):
+        logger.warning(f"[{label}] Failed to fetch page {page_number}: {error}")
+        if page_number in probes:
+            return
+        failed_pages.add(page_number)
+        METRICS.count('pages_failed')
+        if emitter:
+            emitter.done(page_number, [])
+    
+    async def fetcher():
+        while True:
+            page_number = await queue.get()
+            try:
+                target = page_url(pattern, page_number)
+                async with page_pool.page() as worker_page:
+                    await load_page(worker_page, target, politeness, profile=profile)
+                    html_content = await page_html(worker_page)
+                if capture:
+                    capture.record_page(label, url, page_number, target, html_content)
+            except Exception as e:
+                page_failed(page_number, e)
+                queue.task_done()
+                continue
+            # Blocks while the parsers are behind (back-pressure); the page is done once parsed
+            with METRICS.timer('parse_queue_wait'):
+                await parse_queue.put((page_number, html_content))
+    
+    async def parser():
+        nonlocal last_page
+        while True:
+            page_number, html_content = await parse_queue.get()
+            try:
+                if page_number in probes:
+                    _, info = await parse_html_page(html_content, parse_pool, label)
+                    METRICS.count('pages_probed')
+                    extend_frontier(last_known_page(url, pattern, info) if info else None)
+                    continue
                 
-                logger.info(f"Scraping page {current_page}")
-                
-                # Scrape current page data
-                page_data = await scrape_table_data(page)
-                if page_data:
-                    all_data.extend(page_data)
-                    scraped_pages.add(current_page)
-                    logger.info(f"Total rows collected so far: {len(all_data)}")
+                # Incremental runs reuse the stored rows of pages whose table didn't change
+                newest = None
+                table_hash = None
+                if change_index:
+                    with METRICS.timer('table_digest'):
+                        table_hash = table_digest(html_content)
+                cached = change_index.unchanged_page(url, page_number, table_hash, label) if change_index else None
+                if cached:
+                    page_data, newest = cached
+                    info = None
+                    METRICS.count('pages_unchanged')
+                    logger.info(f"[{label}] Page {page_number} unchanged since last run")
                 else:
-                    logger.warning(f"No data found on page {current_page}")
+                    page_data, info = await parse_html_page(html_content, parse_pool, label)
+                    if info:
+                        newest = last_known_page(url, pattern, info)
+                    if change_index:
+                        change_index.record_page(url, page_number, table_hash, page_data, newest)
                 
-                # Find next page to scrape
-                next_page = await find_next_page_to_scrape(page)
-                
-                if next_page and next_page not in scraped_pages:
-                    logger.info(f"Attempting to navigate to page {next_page}")
-                    if await navigate_to_page(page, next_page):
-                        await asyncio.sleep(2)  # Be respectful to the server
-                    else:
-                        logger.warning(f"Failed to navigate to page {next_page}")
-                        break
+                METRICS.count('pages')
+                METRICS.count('rows', len(page_data))
+                if page_data:
+                    rows_by_page[page_number] = page_data if keep_rows else None
+                    if journal:
+                        journal.record_page(url, page_number, page_data, newest)
+                    logger.info(f"[{label}] Page {page_number}: {len(page_data)} rows")
                 else:
-                    logger.info("No more new pages to scrape")
-                    break
+                    logger.warning(f"[{label}] No data found on page {page_number}")
+                if emitter:
+                    emitter.done(page_number, page_data)
                 
-                # Safety break to prevent infinite loops
-                if len(scraped_pages) > 200000:  # Adjust this limit as needed
-                    logger.warning("Reached maximum page limit (10000), stopping")
-                    break
-            
-            logger.info(f"Scraping completed! Scraped pages: {sorted(scraped_pages)}")
-            
-        except Exception as e:
-            logger.error(f"Error during scraping: {e}")
-        
-        finally:
-            await browser.close()
+                extend_frontier(newest)
+            except Exception as e:
+                page_failed(page_number, e)
+            finally:
+                parse_queue.task_done()
+                queue.task_done()
+    
+    # Idle fetchers hold no browser page, so pages queued later (discovered or past probes) get every fetcher
+    tasks = [asyncio.create_task(fetcher()) for _ in range(max(1, page_concurrency))]
+    tasks += [asyncio.create_task(parser()) for _ in range(max(1, parse_pool.workers if parse_pool else 1))]
+    try:
+        await queue.join()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    if last_page < first_page:
+        raise RuntimeError(f"page {first_page} not reached, the pagination ends at page {last_page}")
+
+async def scrape_province(context, url, politeness=None, label=None, page_concurrency=PAGE_CONCURRENCY,
+                          journal=None, on_rows=None, keep_rows=True, change_index=None, profile=FETCH_PROFILE,
+                          capture=None, parse_pool=None, page_range=None, max_pages=MAX_PAGES, page_pool=None):
+    """Scrape every page of one directory listing and return its result.
 
-async def scrape_table_data(page):
+    Page URLs are planned up front from the first page's pagination links and fetched
+    with up to `page_concurrency` pages; if the page parameter can't be learned the
+    crawl falls back to walking the pagination widget. Browser pages are leased from
+    `page_pool`, or from a pool of `page_concurrency` pages in `context` without one.
+    With a `journal`, finished pages are committed as they complete and pages already
+    in it are not fetched again.
+    
+    `on_rows(label, page_number, rows)` receives every page's rows in page order as
+    soon as they are available; with `keep_rows=False` the result doesn't hold rows.
+    A `change_index` lets pages whose table is unchanged since the last run skip parsing,
+    a `capture` receives the raw HTML of every page fetched, and a `parse_pool` moves
+    parsing off the event loop.
+    
+    `page_range=(first, last)` scrapes only those pages (`last=None`: to the end); a
+    listing scraped by range is never marked complete in the journal. `max_pages` is
+    the safety limit on page numbers.
+    """
+    label = label or url
+    result = {'province': label, 'url': url, 'rows': [], 'pages': [], 'failed_pages': [], 'error': None}
+    first_page, last_page = page_range or (1, None)
+    page_limit = min(last_page or max_pages, max_pages)
+    emitter = OrderedPageEmitter(label, on_rows, first_page)
+    
+    if journal:
+        journal.start_listing(url, label)
+        if journal.is_complete(url) and not page_range:
+            rows_by_page = journal.completed_pages(url)
+            for page_number in sorted(rows_by_page):
+                if keep_rows:
+                    result['rows'].extend(rows_by_page[page_number])
+                emitter.done(page_number, rows_by_page[page_number])
+            emitter.flush()
+            result['pages'] = sorted(rows_by_page)
+            logger.info(f"[{label}] Already complete in journal: {len(result['pages'])} pages")
+            return result
+    
+    own_pool = page_pool is None
+    if own_pool:
+        page_pool = PagePool.for_context(context, page_concurrency).start()
+    page = None
+    failed = False
+    
     try:
-        # Get the page HTML content
-        html_content = await page.content()
+        page = await page_pool.acquire()
+        # Navigate to the province URL
+        logger.info(f"[{label}] Navigating to {url}")
+        await load_page(page, url, politeness, profile=profile)
         
-        # Parse with BeautifulSoup
-        soup = BeautifulSoup(html_content, 'html.parser')
+        html_content = await page_html(page)
+        first_rows, pagination_info = await parse_html_page(html_content, parse_pool, label)
+        if pagination_info and pagination_info['current_page'] < first_page:
+            # Only read for its pagination links
+            first_rows = []
+        if capture:
+            capture.record_page(label, url, pagination_info['current_page'] if pagination_info else 1, url,
+                                html_content)
+        pattern = learn_page_url_pattern(url, pagination_info)
+        if change_index and pattern:
+            change_index.record_page(url, pagination_info['current_page'], table_digest(html_content), first_rows,
+                                     last_known_page(url, pattern, pagination_info))
         
-        # Find the table with id 'newspaper-a'
-        table = soup.find('table', {'id': 'newspaper-a'})
-        if not table:
-            logger.warning("Table not found on page")
-            return []
+        if pattern:
+            METRICS.count('pages')
+            METRICS.count('rows', len(first_rows))
+            rows_by_page = journal.completed_pages(url) if journal else {}
+            rows_by_page = {page_number: rows for page_number, rows in rows_by_page.items()
+                            if first_page <= page_number <= page_limit}
+            if rows_by_page:
+                logger.info(f"[{label}] Resuming: {len(rows_by_page)} pages already in journal")
+                METRICS.count('pages_from_journal', len(rows_by_page))
+            failed_pages = set()
+            if first_rows:
+                rows_by_page[pagination_info['current_page']] = first_rows
+                if journal:
+                    journal.record_page(url, pagination_info['current_page'], first_rows,
+                                        last_known_page(url, pattern, pagination_info))
+            elif pagination_info['current_page'] >= first_page:
+                emitter.done(pagination_info['current_page'], [])
+            for page_number in sorted(rows_by_page):
+                emitter.done(page_number, rows_by_page[page_number])
+                if not keep_rows:
+                    rows_by_page[page_number] = None
+            # The first page goes back to the pool for the fetchers
+            await page_pool.release(page)
+            page = None
+            await fetch_planned_pages(page_pool, url, pattern, pagination_info, label, politeness,
+                                      page_concurrency, rows_by_page, failed_pages, journal, emitter, keep_rows,
+                                      change_index, profile, capture, parse_pool, first_page, page_limit,
+                                      journal.last_known_page(url) if journal else 0)
+            for page_number in sorted(rows_by_page):
+                result['rows'].extend(rows_by_page[page_number] or [])
+            result['pages'] = sorted(rows_by_page)
+            result['failed_pages'] = sorted(failed_pages)
+        else:
+            logger.info(f"[{label}] Page URL pattern not recognised, walking the pagination widget")
+            # walk_pagination() takes over the first page's lease and scrapes the HTML already read
+            leased, page = page, None
+            await walk_pagination(page_pool, leased, url, label, politeness, result, journal, emitter, keep_rows,
+                                  profile, capture, first_page, page_limit, html_content)
         
-        # Extract all rows
-        rows = []
-        table_rows = table.find_all('tr')
+        logger.info(f"[{label}] Scraping completed! Scraped {len(result['pages'])} pages")
+        if result['failed_pages']:
+            logger.warning(f"[{label}] Failed pages: {result['failed_pages']}")
+        elif journal and not page_range:
+            journal.mark_complete(url)
         
-        for row in table_rows:
-            # Check if this is a row with bgcolor="white" and valign="top"
-            is_white_row = (row.get('bgcolor') == 'white' and row.get('valign') == 'top')
-            
-            cells = row.find_all(['td', 'th'])
-            if cells:
-                if is_white_row:
-                    # For white rows, parse BR-separated content and reconstruct proper columns
-                    all_segments = []
-                    
-                    # Extract all segments from all cells
-                    for cell in cells:
-                        # Create a copy of the cell to avoid modifying the original
-                        cell_copy = BeautifulSoup(str(cell), 'html.parser').find(['td', 'th'])
-                        
-                        # Replace <br> tags with a special delimiter
-                        for br in cell_copy.find_all('br'):
-                            br.replace_with('|||BR_SEPARATOR|||')
-                        
-                        # Get the text and split by our delimiter
-                        cell_text = cell_copy.get_text()
-                        segments = cell_text.split('|||BR_SEPARATOR|||')
-                        
-                        # Clean and collect all non-empty segments
-                        for segment in segments:
-                            cleaned_segment = segment.strip()
-                            if cleaned_segment:
-                                all_segments.append(cleaned_segment)
-                    
-                    # Now reconstruct the row based on patterns in the data
-                    if len(all_segments) >= 3:
-                        reconstructed_row = []
-                        
-                        # First segment should be the number (ID)
-                        reconstructed_row.append(all_segments[0])
-                        
-                        # Second segment should be company name
-                        reconstructed_row.append(all_segments[1])
-                        
-                        # Third segment should be KBLI code
-                        reconstructed_row.append(all_segments[2])
-                        
-                        # Fourth segment (if exists) should be address
-                        if len(all_segments) > 3:
-                            reconstructed_row.append(all_segments[3])
-                        else:
-                            reconstructed_row.append('')
-                        
-                        # Look for phone number (usually starts with "Telp." or contains phone patterns)
-                        phone = ''
-                        for segment in all_segments[4:]:
-                            if 'telp' in segment.lower() or 'phone' in segment.lower() or segment.startswith('0') or segment.startswith('+'):
-                                phone = segment
-                                break
-                        reconstructed_row.append(phone)
-                        
-                        # Add any remaining segments as additional columns
-                        remaining_segments = [seg for seg in all_segments[4:] if seg != phone]
-                        for seg in remaining_segments:
-                            reconstructed_row.append(seg)
-                        
-                        rows.append(reconstructed_row)
-                    else:
-                        # If we don't have enough segments, fall back to original method
-                        row_data = [cell.get_text(strip=True) for cell in cells]
-                        rows.append(row_data)
-                        
-                else:
-                    # For non-white rows, use the original method
-                    row_data = [cell.get_text(strip=True) for cell in cells]
-                    rows.append(row_data)
+    except Exception as e:
+        logger.error(f"[{label}] Error during scraping: {e}")
+        result['error'] = str(e)
+        failed = True
+    
+    finally:
+        emitter.flush()
+        if page is not None:
+            await page_pool.release(page, failed=failed)
+        if own_pool:
+            await page_pool.close()
+    
+    return result
+
+@asynccontextmanager
+async def browser_contexts(backend=FETCH_BACKEND, politeness=None, profile=FETCH_PROFILE, headless=True):
+    """Yield a `new_context()` coroutine function for the chosen fetch backend.
+
+    'playwright' shares one Chromium and hands out a browser context per call; 'http'
+    shares one pooled aiohttp session and only starts Chromium for pages whose static
+    HTML lacks the table. `headless=False` shows the browser window.
+    """
+    if backend == 'http':
+        from http_fetch import HttpContext, PlaywrightFallback, create_session
+        
+        politeness = politeness or HostPoliteness()
+        fallback = PlaywrightFallback(headless, politeness.navigation_timeout, politeness.table_timeout)
+        async with create_session(limit_per_host=politeness.max_in_flight,
+                                  timeout=politeness.navigation_timeout) as session:
+            async def new_http_context():
+                return HttpContext(session, fallback)
+            try:
+                yield new_http_context
+            finally:
+                await fallback.close()
+        return
+    
+    if backend != 'playwright':
+        raise ValueError(f"Unknown fetch backend: {backend}")
+    
+    from playwright.async_api import async_playwright
+    
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=headless, args=FETCH_PROFILES[profile]['launch_args'])
         
-        logger.info(f"Extracted {len(rows)} rows from current page")
-        return rows
+        async def new_playwright_context():
+            return await new_browser_context(browser, profile)
+        try:
+            yield new_playwright_context
+        finally:
+            await browser.close()
+
+async def scrape_provinces(provinces=None, max_concurrency=MAX_CONCURRENCY, politeness=None, what='',
+                           backend=FETCH_BACKEND, journal=None, on_rows=None, keep_rows=True, change_index=None,
+                           profile=FETCH_PROFILE, capture=None, parse_workers=PARSE_WORKERS,
+                           page_concurrency=PAGE_CONCURRENCY, page_range=None, max_pages=MAX_PAGES, headless=True,
+                           page_pool_size=None, recycle_after=RECYCLE_NAVIGATIONS, max_rss_mb=RECYCLE_RSS_MB):
+    """Scrape several provinces concurrently and return {province: result}.
+
+    At most `max_concurrency` provinces run at once and all requests share the per-host
+    politeness budget, one pool of `parse_workers` parser processes (0 parses on the
+    event loop) and one pool of warm browser pages from `browser_contexts(backend)`:
+    `page_pool_size` pages (default: one per province page slot), each recycled after
+    `recycle_after` navigations or while the browser's memory is above `max_rss_mb`.
+    `profile` selects the Playwright page-load profile; `what`, `page_concurrency`,
+    `page_range` and `max_pages` apply to every province.
+    """
+    provinces = list(provinces or PROVINCES)
+    politeness = politeness or HostPoliteness()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    parse_pool = ParsePool(parse_workers).start()
+    
+    async with browser_contexts(backend, politeness, profile, headless) as new_context:
+        # Pages open in the background while the first provinces are already loading
+        page_pool_size = page_pool_size or min(max_concurrency, len(provinces)) * max(1, page_concurrency)
+        page_pool = PagePool(new_context, page_pool_size, recycle_after, max_rss_mb).start()
+        
+        async def worker(province):
+            async with semaphore:
+                return await scrape_province(None, province_url(province, what), politeness,
+                                             page_concurrency=page_concurrency, label=province,
+                                             journal=journal, on_rows=on_rows, keep_rows=keep_rows,
+                                             change_index=change_index, profile=profile, capture=capture,
+                                             parse_pool=parse_pool, page_range=page_range,
+                                             max_pages=max_pages, page_pool=page_pool)
+        
+        try:
+            results = await asyncio.gather(*(worker(province) for province in provinces))
+        finally:
+            parse_pool.close()
+            page_pool.log_summary()
+            politeness.log_summary()
+            await page_pool.close()
+        return {result['province']: result for result in results}
+
+async def scrape_all_pages(url=None, profile=FETCH_PROFILE, backend=FETCH_BACKEND, politeness=None, label=None,
+                           parse_workers=PARSE_WORKERS):
+    """Scrape a single listing URL (defaults to `base_url`) and append its rows to `all_data`."""
+    global all_data
+    
+    url = url or base_url
+    parse_pool = ParsePool(parse_workers).start()
+    try:
+        async with browser_contexts(backend, politeness, profile) as new_context:
+            context = await new_context()
+            try:
+                result = await scrape_province(context, url, politeness, label=label, profile=profile,
+                                               parse_pool=parse_pool)
+            finally:
+                await context.close()
+    finally:
+        parse_pool.close()
+    
+    all_data.extend(result['rows'])
+    return result
+
+async def scrape_table_data(page, province=None, html_content=None):
+    try:
+        # Get the page HTML content (unless the caller already read it) and parse the table into CompanyRecords
+        html_content = html_content or await page_html(page)
+        with METRICS.timer('parse_table'):
+            return parse_rows(html_content, province)
         
     except Exception as e:
         logger.error(f"Error extracting table data: {e}")
         return []
 
 def create_dataframe(data):
+    import pandas as pd
+    
     if not data:
         return pd.DataFrame()
     
-    # Remove duplicate rows
-    unique_data = []
-    seen_rows = set()
-    
-    for row in data:
-        row_tuple = tuple(str(cell).strip() for cell in row)
-        if row_tuple not in seen_rows:
-            seen_rows.add(row_tuple)
-            unique_data.append(row)
+    # One column per CompanyRecord field, built column-wise; number and KBLI are nullable integers
+    columns = {column: [getattr(record, column) for record in data] for column in COLUMNS}
+    columns['number'] = pd.array(columns['number'], dtype='Int64')
+    columns['kbli'] = pd.array(columns['kbli'], dtype='Int32')
+    df = pd.DataFrame(columns)
     
-    logger.info(f"Removed {len(data) - len(unique_data)} duplicate rows")
+    # Bersihkan DataFrame (fields are already stripped by the parser)
+    before = len(df)
+    df = df.drop_duplicates().reset_index(drop=True)
+    logger.info(f"Removed {before - len(df)} duplicate rows")
     
-    # Tentukan jumlah kolom maksimum
-    max_cols = max(len(row) for row in unique_data)
+    # Repetitive text columns (legal form, regency, province, ...) are stored as categoricals
+    for col in df.select_dtypes(exclude='number').columns:
+        if df[col].nunique() <= len(df) * CATEGORY_MAX_RATIO:
+            df[col] = df[col].astype('category')
     
-    # Pad semua baris agar punya jumlah kolom yang sama
-    padded_data = [row + [''] * (max_cols - len(row)) for row in unique_data]
+    return df
 
-    # Buat header default jika tidak tersedia
-    column_names = [f"Column_{i+1}" for i in range(max_cols)]
-    
-    df = pd.DataFrame(padded_data, columns=column_names)
 
-    # Bersihkan DataFrame
-    df = df.apply(lambda x: x.str.strip() if x.dtype == "object" else x)
-    df = df.dropna(how='all').drop_duplicates().reset_index(drop=True)
+class ResultSet:
+    """The CompanyRecords of a run, turned into a DataFrame once and shared by every exporter."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.source_rows = len(rows)
+        self._frame = None
+
+    @property
+    def frame(self):
+        if self._frame is None:
+            # pandas is loaded on first use; the 'dataframe' stage times the conversion only
+            with METRICS.timer('import_pandas'):
+                import pandas  # noqa: F401
+            with METRICS.timer('dataframe'):
+                self._frame = create_dataframe(self.rows)
+        return self._frame
+
+    @property
+    def empty(self):
+        return self.frame.empty
     
-    return df
+    def normalize(self):
+        """Add the normalized address, phone and KBLI columns (normalize.py) for every later stage."""
+        from normalize import normalize_frame
+        
+        frame = self.frame
+        with METRICS.timer('normalize'):
+            self._frame = normalize_frame(frame)
+        return self
 
+    def __len__(self):
+        return len(self.frame)
 
-def save_to_csv(filename=None):
-    global all_data
+
+_result_set = None
+
+def get_result_set():
+    """ResultSet for `all_data`, rebuilt only when rows were added since the last call."""
+    global _result_set
+    if _result_set is None or _result_set.rows is not all_data or _result_set.source_rows != len(all_data):
+        _result_set = ResultSet(all_data)
+    return _result_set
+
+
+def save_to_csv(filename=None, result=None):
+    if result is None:
+        result = get_result_set()
     
     if not filename:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"kemenperin_companies_{timestamp}.csv"
     
-    if not all_data:
+    if not result.rows:
         logger.warning("No data to save")
         return
     
     try:
-        df = create_dataframe(all_data)
-        df.to_csv(filename, index=False, encoding='utf-8')
+        df = result.frame
+        with METRICS.timer('export.csv'):
+            df.to_csv(filename, index=False, encoding='utf-8')
         logger.info(f"Data saved to {filename} ({len(df)} rows)")
         
     except Exception as e:
         logger.error(f"Error saving to CSV: {e}")
 
-def save_to_json(filename=None):
-    global all_data
+def save_to_json(filename=None, result=None):
+    if result is None:
+        result = get_result_set()
     
     if not filename:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"kemenperin_companies_{timestamp}.json"
     
-    if not all_data:
+    if not result.rows:
         logger.warning("No data to save")
         return
     
     try:
-        df = create_dataframe(all_data)
-        df.to_json(filename, orient='records', force_ascii=False, indent=2)
+        df = result.frame
+        with METRICS.timer('export.json'):
+            df.to_json(filename, orient='records', force_ascii=False)
         logger.info(f"Data saved to {filename} ({len(df)} records)")
         
     except Exception as e:
         logger.error(f"Error saving to JSON: {e}")
 
-def save_to_excel(filename=None):
-    """Save scraped data to Excel file using pandas with formatting"""
-    global all_data
+def save_to_ndjson(filename=None, result=None):
+    # One JSON object per line, for streaming consumers
+    if result is None:
+        result = get_result_set()
     
     if not filename:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"kemenperin_companies_{timestamp}.xlsx"
+        filename = f"kemenperin_companies_{timestamp}.ndjson"
     
-    if not all_data:
+    if not result.rows:
         logger.warning("No data to save")
         return
     
     try:
-        df = create_dataframe(all_data)
+        df = result.frame
+        with METRICS.timer('export.ndjson'):
+            df.to_json(filename, orient='records', lines=True, force_ascii=False)
+        logger.info(f"Data saved to {filename} ({len(df)} records)")
         
-        # Save to Excel with formatting
-        with pd.ExcelWriter(filename, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Companies', index=False)
+    except Exception as e:
+        logger.error(f"Error saving to NDJSON: {e}")
+
+def excel_column_widths(df):
+    # Longest cell per column (vectorized), header included, padded and capped like before
+    widths = []
+    for col in df.columns:
+        lengths = df[col].astype(str).str.len()
+        longest = int(lengths.max()) if len(lengths) else 0
+        widths.append(min(max(longest, len(str(col))) + 2, 50))
+    return widths
+
+def excel_sheet_name(name):
+    # Excel sheet names: at most 31 characters, none of []:*?/\
+    return re.sub(r'[\[\]:*?/\\]', '_', str(name))[:31] or 'Sheet'
+
+def save_to_excel(filename=None, result=None, by_province=False):
+    """Save scraped data to Excel, streaming rows with xlsxwriter's constant-memory mode.
+
+    With `by_province` each province gets its own sheet; openpyxl is used when
+    xlsxwriter isn't installed.
+    """
+    if result is None:
+        result = get_result_set()
+    
+    if not filename:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"kemenperin_companies_{timestamp}.xlsx"
+    
+    if not result.rows:
+        logger.warning("No data to save")
+        return
+    
+    try:
+        df = result.frame
+        with METRICS.timer('export.xlsx'):
+            widths = excel_column_widths(df)
+            
+            if by_province:
+                sheets = [(excel_sheet_name(name), group) for name, group in df.groupby('province', sort=False, observed=True)]
+            else:
+                sheets = [('Companies', df)]
+            
+            try:
+                import xlsxwriter
+            except ImportError:
+                xlsxwriter = None
             
-            # Auto-adjust column widths
-            worksheet = writer.sheets['Companies']
-            for idx, col in enumerate(df.columns):
-                max_length = max(
-                    df[col].astype(str).map(len).max(),
-                    len(str(col))
-                ) + 2
-                worksheet.column_dimensions[chr(65 + idx)].width = min(max_length, 50)
+            if xlsxwriter:
+                options = {'constant_memory': True, 'strings_to_numbers': False, 'strings_to_urls': False,
+                           'strings_to_formulas': False}
+                with xlsxwriter.Workbook(filename, options) as workbook:
+                    header_format = workbook.add_format({'bold': True})
+                    for sheet_name, frame in sheets:
+                        worksheet = workbook.add_worksheet(sheet_name)
+                        for idx, width in enumerate(widths):
+                            worksheet.set_column(idx, idx, width)
+                        # constant_memory requires row-major writes, so rows are written directly
+                        worksheet.write_row(0, 0, list(frame.columns), header_format)
+                        # Missing KBLI/number (<NA>) become blank cells
+                        columns = [frame[col].astype(object).where(frame[col].notna(), None).tolist()
+                                   for col in frame.columns]
+                        for row_idx, row in enumerate(zip(*columns), start=1):
+                            worksheet.write_row(row_idx, 0, row)
+            else:
+                import pandas as pd
+                from openpyxl.utils import get_column_letter
+                
+                with pd.ExcelWriter(filename, engine='openpyxl') as writer:
+                    for sheet_name, frame in sheets:
+                        frame.to_excel(writer, sheet_name=sheet_name, index=False)
+                        worksheet = writer.sheets[sheet_name]
+                        for idx, width in enumerate(widths):
+                            worksheet.column_dimensions[get_column_letter(idx + 1)].width = width
         
-        logger.info(f"Data saved to {filename} ({len(df)} rows)")
+        logger.info(f"Data saved to {filename} ({len(df)} rows, {len(sheets)} sheets)")
         
     except Exception as e:
         logger.error(f"Error saving to Excel: {e}")
 
-def analyze_data():
-    global all_data
+def analyze_data(result=None):
+    if result is None:
+        result = get_result_set()
     
-    if not all_data or len(all_data) < 2:
+    if len(result.rows) < 2:
         logger.warning("Not enough data to analyze")
         return
     
     try:
-        df = create_dataframe(all_data)
-        
-        logger.info("\n=== Data Analysis ===")
-        logger.info(f"Total records: {len(df)}")
-        logger.info(f"Columns: {', '.join(df.columns)}")
-        
-        # Show data types
-        logger.info("\nData types:")
-        for col in df.columns:
-            logger.info(f"  {col}: {df[col].dtype}")
-        
-        # Show first few rows
-        logger.info("\nFirst 5 rows:")
-        logger.info(df.head().to_string())
-        
-        # Basic statistics for numeric columns
-        numeric_cols = df.select_dtypes(include=['int64', 'float64']).columns
-        if len(numeric_cols) > 0:
-            logger.info("\nNumeric column statistics:")
-            logger.info(df[numeric_cols].describe().to_string())
-        
-        # Check for missing values
-        missing_values = df.isnull().sum()
-        if missing_values.any():
-            logger.info("\nMissing values per column:")
-            logger.info(missing_values[missing_values > 0].to_string())
+        df = result.frame
+        with METRICS.timer('analysis'):
+            logger.info("\n=== Data Analysis ===")
+            logger.info(f"Total records: {len(df)}")
+            logger.info(f"Columns: {', '.join(df.columns)}")
+            
+            # Show data types
+            logger.info("\nData types:")
+            for col in df.columns:
+                logger.info(f"  {col}: {df[col].dtype}")
+            
+            # Show first few rows
+            logger.info("\nFirst 5 rows:")
+            logger.info(df.head().to_string())
+            
+            # Basic statistics for numeric columns
+            numeric_cols = df.select_dtypes(include='number').columns
+            if len(numeric_cols) > 0:
+                logger.info("\nNumeric column statistics:")
+                logger.info(df[numeric_cols].describe().to_string())
+            
+            # Companies per regency and district once the addresses are split
+            if 'district' in df.columns:
+                logger.info("\nTop districts (kecamatan):")
+                top = df.groupby(['regency', 'district'], observed=True).size().nlargest(10)
+                logger.info(top.to_string())
+            
+            # Check for missing values
+            missing_values = df.isnull().sum()
+            if missing_values.any():
+                logger.info("\nMissing values per column:")
+                logger.info(missing_values[missing_values > 0].to_string())
         
     except Exception as e:
         logger.error(f"Error analyzing data: {e}")
 
-async def main():
-    global all_data
+def open_outputs(basename, formats=OUTPUT_FORMATS, analyze=True, dataset_dir=None, dataset_format='parquet',
+                 company_index_path=None, run_id=None, extra_sinks=(), normalize=False):
+    """Return (pipeline, collector) for a run's outputs.
+
+    Rows stream page by page through dedup into the file writers; only xlsx, the analysis
+    and the normalized export need every row in memory, so `collector` is None unless one
+    of them is wanted.
+    """
+    collector = CollectSink() if 'xlsx' in formats or analyze or normalize else None
+    # The partitioned dataset grows run by run: each run adds its own part files
+    dataset = DatasetSink(dataset_dir, dataset_format, run_id=run_id) if dataset_dir else None
+    company_index = CompanyIndex(company_index_path, run_id=run_id) if company_index_path else None
+    sinks = [sink for sink in (dataset, company_index, collector, *extra_sinks) if sink]
+    return RowPipeline(open_sinks(formats, basename) + sinks), collector
+
+def finish_outputs(pipeline, collector, basename, formats=OUTPUT_FORMATS, analyze=True, xlsx_by_province=False,
+                   metrics_path=None, normalize=False):
+    # Stages that need every row, once the (closed) pipeline has seen them all
+    if not pipeline.rows_out:
+        logger.warning("No data was scraped")
+        METRICS.save(metrics_path or f"{basename}.metrics.json")
+        return
+    
+    logger.info(f"Scraping completed! Total rows: {pipeline.rows_in} ({pipeline.rows_out} unique)")
+    
+    if collector:
+        # The DataFrame is built once and shared by every stage that needs it
+        result = ResultSet(collector.rows)
+        if normalize:
+            # Split addresses and clean phones once for the whole run; xlsx and the analysis get the columns too
+            result.normalize()
+            save_to_csv(f"{basename}.normalized.csv", result)
+        if analyze:
+            analyze_data(result)
+        if 'xlsx' in formats:
+            save_to_excel(f"{basename}.xlsx", result, by_province=xlsx_by_province)
     
+    METRICS.log_summary()
+    METRICS.save(metrics_path or f"{basename}.metrics.json")
+
+async def main(provinces=None, backend=FETCH_BACKEND, resume=False, journal_path=DEFAULT_JOURNAL_PATH,
+               formats=OUTPUT_FORMATS, analyze=True, xlsx_by_province=False, incremental=False,
+               index_path=DEFAULT_INDEX_PATH, metrics_path=None, metrics_port=None, capture_dir=None,
+               dataset_dir=None, dataset_format='parquet', company_index_path=None, what='', output_dir='.',
+               basename=None, max_concurrency=MAX_CONCURRENCY, page_concurrency=PAGE_CONCURRENCY,
+               parse_workers=PARSE_WORKERS, politeness=None, profile=FETCH_PROFILE, page_range=None,
+               max_pages=MAX_PAGES, headless=True, page_pool_size=None, recycle_after=RECYCLE_NAVIGATIONS,
+               max_rss_mb=RECYCLE_RSS_MB, normalize=False):
+    """Scrape `provinces` (default: all of PROVINCES) and write the selected outputs.
+
+    Only the stages a run asks for are set up: no DataFrame (and no pandas import) unless
+    xlsx, the analysis or `normalize` is wanted, no journal with `journal_path=None`. Outputs are named
+    `<output_dir>/<basename>.<format>`, the basename defaulting to a timestamped name.
+    """
     logger.info("Starting Kemenperin company directory scraping...")
+    METRICS.reset()
     #logger.info("Using Playwright for browser automation + BeautifulSoup for parsing + pandas for data manipulation")
     
-    await scrape_all_pages()
+    provinces = list(provinces or PROVINCES)
+    journal = CrawlJournal(journal_path) if journal_path else None
+    if journal and resume:
+        for entry in journal.summary():
+            logger.info(f"[{entry['province']}] Journal: {entry['pages']} pages, {entry['rows']} rows"
+                        f"{' (complete)' if entry['complete'] else ''}")
+    elif journal:
+        for province in provinces:
+            journal.reset(province_url(province, what))
     
-    if all_data:
-        logger.info(f"Scraping completed! Total rows: {len(all_data)}")
-        
-        # Analyze the data
-        analyze_data()
-        
-        # Save data in multiple formats
-        save_to_csv()
-        save_to_json()
-        save_to_excel()
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    os.makedirs(output_dir, exist_ok=True)
+    basename = os.path.join(output_dir, basename or f"kemenperin_companies_{timestamp}")
+    change_index = ChangeIndex(index_path) if incremental else None
+    if change_index:
+        for province in provinces:
+            change_index.adopt_province(province, province_url(province, what))
+    tracker = ChangeTracker(change_index) if change_index else None
+    capture = PageCapture(capture_dir, BASE_URL) if capture_dir else None
+    pipeline, collector = open_outputs(basename, formats, analyze, dataset_dir, dataset_format, company_index_path,
+                                       timestamp, extra_sinks=[tracker] if tracker else [], normalize=normalize)
+    
+    def on_rows(province, page_number, rows):
+        pipeline.write(rows, province)
+    
+    # Optional live view of the metrics for long runs (Prometheus text format)
+    metrics_server = await serve_prometheus(METRICS, metrics_port) if metrics_port else None
+    try:
+        results = await scrape_provinces(provinces, max_concurrency, politeness, what, backend=backend,
+                                         journal=journal, on_rows=on_rows, keep_rows=False,
+                                         change_index=change_index, profile=profile, capture=capture,
+                                         parse_workers=parse_workers, page_concurrency=page_concurrency,
+                                         page_range=page_range, max_pages=max_pages, headless=headless,
+                                         page_pool_size=page_pool_size, recycle_after=recycle_after,
+                                         max_rss_mb=max_rss_mb)
+        if tracker:
+            # A page range covers part of each listing; comparing it would report the rest as removed
+            complete = {name: result['url'] for name, result in results.items()
+                        if not result['error'] and not result['failed_pages'] and not page_range}
+            if page_range:
+                logger.info("Page range given: the delta and the company index are left unchanged")
+            with METRICS.timer('export.delta'):
+                tracker.finish(f"{basename}.delta.ndjson", complete)
+    finally:
+        if journal:
+            journal.close()
+        pipeline.close()
+        if change_index:
+            change_index.close()
+        if capture:
+            capture.close()
+        if metrics_server:
+            await metrics_server.cleanup()
+    
+    for province, result in results.items():
+        status = f"failed: {result['error']}" if result['error'] else "ok"
+        if result['failed_pages']:
+            status += f", {len(result['failed_pages'])} pages failed" + (" (rerun with --resume)" if journal else "")
+        logger.info(f"[{province}] {len(result['pages'])} pages ({status})")
+    
+    finish_outputs(pipeline, collector, basename, formats, analyze, xlsx_by_province, metrics_path, normalize)
+
+def parse_page_range(text):
+    """'5-20' -> (5, 20), '5-' -> (5, None), '7' -> (7, 7)."""
+    first, dash, last = text.partition('-')
+    try:
+        page_range = (int(first), int(last) if last else None) if dash else (int(first), int(first))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid page range {text!r} (expected FIRST-LAST, FIRST- or PAGE)")
+    if page_range[0] < 1 or (page_range[1] is not None and page_range[1] < page_range[0]):
+        raise argparse.ArgumentTypeError(f"invalid page range {text!r}")
+    return page_range
+
+def bounded_number(convert, allow_zero):
+    """argparse type for counts, rates and timeouts: `convert`ed, > 0 (or >= 0 with `allow_zero`)."""
+    description = f"{'non-negative' if allow_zero else 'positive'} {'integer' if convert is int else 'number'}"
+    def parse(text):
+        try:
+            value = convert(text)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid {description} {text!r}")
+        if value < 0 or (value == 0 and not allow_zero):
+            raise argparse.ArgumentTypeError(f"{text!r} is not a {description}")
+        return value
+    return parse
+
+positive_int = bounded_number(int, allow_zero=False)
+non_negative_int = bounded_number(int, allow_zero=True)
+positive_float = bounded_number(float, allow_zero=False)
+non_negative_float = bounded_number(float, allow_zero=True)
+
+def load_config_file(path):
+    """Run options from a TOML or JSON file, keyed like the command-line options."""
+    if path.endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            options = json.load(f)
     else:
-        logger.warning("No data was scraped")
+        import tomllib
+        
+        with open(path, 'rb') as f:
+            options = tomllib.load(f)
+    return {key.replace('-', '_'): value for key, value in options.items()}
+
+def config_value(parser, action, key, value, path):
+    # A config value checked and converted like the same value on the command line would be
+    many = action.nargs in ('+', '*')
+    if many and not isinstance(value, list):
+        value = [value]
+    elif not many and isinstance(value, list):
+        parser.error(f"{key} in {path} takes a single value, not a list")
+    values = value if many else [value]
+    try:
+        if action.type:
+            # Numbers from the file go through the same checks as their command-line spelling
+            values = [action.type(item if isinstance(item, str) else json.dumps(item)) for item in values]
+    except (argparse.ArgumentTypeError, TypeError, ValueError) as e:
+        parser.error(f"{key} in {path}: {e}")
+    if action.choices is not None:
+        for item in values:
+            if item not in action.choices:
+                parser.error(f"{key} in {path}: invalid choice {item!r} "
+                             f"(choose from {', '.join(map(str, action.choices))})")
+    return values if many else values[0]
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Scrape the Kemenperin company directory")
+    parser.add_argument('--config', metavar='FILE',
+                        help="TOML or JSON file with any of the options below; command-line options win")
+    
+    scope = parser.add_argument_group('what to scrape')
+    scope.add_argument('--provinces', nargs='+', metavar='PROVINCE', choices=list(PROVINCES),
+                       help="provinces to scrape (default: all)")
+    scope.add_argument('--list-provinces', action='store_true', help="print the known provinces and exit")
+    scope.add_argument('--what', default='', help="search term (the directory's what= parameter)")
+    scope.add_argument('--pages', type=parse_page_range, dest='page_range', metavar='RANGE',
+                       help="page range per province: FIRST-LAST, FIRST- or PAGE")
+    scope.add_argument('--max-pages', type=positive_int, default=MAX_PAGES, help="safety limit on pages per province")
+    
+    fetching = parser.add_argument_group('fetching')
+    fetching.add_argument('--backend', default=FETCH_BACKEND, choices=('playwright', 'http'))
+    fetching.add_argument('--profile', default=FETCH_PROFILE, choices=sorted(FETCH_PROFILES),
+                          help="Playwright page-load profile")
+    fetching.add_argument('--headed', action='store_true', help="show the browser window")
+    fetching.add_argument('--concurrency', type=positive_int, default=MAX_CONCURRENCY, dest='max_concurrency',
+                          help="provinces scraped at the same time")
+    fetching.add_argument('--page-concurrency', type=positive_int, default=PAGE_CONCURRENCY, help="pages per province")
+    fetching.add_argument('--page-pool', type=positive_int, dest='page_pool_size',
+                          help="warm browser pages shared by all provinces (default: concurrency x page concurrency)")
+    fetching.add_argument('--recycle-after', type=positive_int, default=RECYCLE_NAVIGATIONS,
+                          help="navigations before a pooled page is replaced")
+    fetching.add_argument('--recycle-rss-mb', type=non_negative_float, default=RECYCLE_RSS_MB, dest='max_rss_mb',
+                          help="recycle pooled pages while the scraper and browser use more memory (0 = off)")
+    fetching.add_argument('--parse-workers', type=non_negative_int, default=PARSE_WORKERS, help="parser processes (0 = inline)")
+    fetching.add_argument('--max-in-flight', type=positive_int, default=PER_HOST_CONCURRENCY, help="requests in flight per host")
+    fetching.add_argument('--rate', type=non_negative_float, default=INITIAL_RATE,
+                          help="starting requests/sec per host, adapted to the server's latency (0 = unlimited)")
+    fetching.add_argument('--max-rate', type=positive_float, default=MAX_RATE, help="upper bound for the adaptive rate")
+    fetching.add_argument('--max-retries', type=non_negative_int, default=MAX_RETRIES, help="retries per page")
+    fetching.add_argument('--navigation-timeout', type=positive_float, default=NAVIGATION_TIMEOUT,
+                          help="seconds for a page to load before the attempt fails")
+    fetching.add_argument('--table-timeout', type=positive_float, default=TABLE_TIMEOUT,
+                          help="seconds to wait for the directory table once the page has loaded")
+    
+    output = parser.add_argument_group('output')
+    output.add_argument('--formats', nargs='+', default=list(OUTPUT_FORMATS),
+                        choices=sorted(STREAM_SINKS) + ['xlsx'], help="output formats")
+    output.add_argument('--output-dir', default='.', help="directory for the output files")
+    output.add_argument('--basename', help="output file name without extension (default: kemenperin_companies_<time>)")
+    output.add_argument('--no-analysis', action='store_false', dest='analyze', help="skip the console analysis")
+    output.add_argument('--normalize', action='store_true',
+                        help="also write <name>.normalized.csv with village, district, cleaned phone and KBLI columns")
+    output.add_argument('--xlsx-by-province', action='store_true', help="one Excel sheet per province")
+    output.add_argument('--dataset', metavar='DIR',
+                        help="also add the rows to a columnar dataset partitioned by province and KBLI prefix")
+    output.add_argument('--dataset-format', default='parquet', choices=DATASET_FORMATS,
+                        help="dataset file format (arrow = uncompressed Arrow IPC for memory-mapped reads)")
+    output.add_argument('--company-index', metavar='PATH',
+                        help="upsert every company into this cross-run index (SQLite, see company_index.py)")
+    
+    state = parser.add_argument_group('state and diagnostics')
+    state.add_argument('--resume', action='store_true', help="continue from the crawl journal instead of starting over")
+    state.add_argument('--journal', default=DEFAULT_JOURNAL_PATH, help="crawl journal path (SQLite)")
+    state.add_argument('--no-journal', action='store_const', const=None, dest='journal',
+                       help="don't keep a crawl journal (no --resume)")
+    state.add_argument('--incremental', action='store_true',
+                       help="skip parsing pages unchanged since the last run and write a delta file")
+    state.add_argument('--index', default=DEFAULT_INDEX_PATH, help="content-hash index path (SQLite)")
+    state.add_argument('--metrics', help="metrics report path (default: <output name>.metrics.json)")
+    state.add_argument('--metrics-port', type=int, help="serve Prometheus metrics on this port during the run")
+    state.add_argument('--capture', metavar='DIR', help="save the raw HTML of every fetched page for offline replay")
+    return parser
+
+def parse_args(argv=None):
+    """Command-line options on top of the --config file on top of the module defaults."""
+    parser = build_arg_parser()
+    known, _ = parser.parse_known_args(argv)
+    if known.config:
+        # File keys are option names ('max-pages', 'no-analysis') or their destinations ('max_pages', 'analyze')
+        actions = {action.dest: action for action in parser._actions}
+        actions.update({option.lstrip('-').replace('-', '_'): action
+                        for action in parser._actions for option in action.option_strings})
+        defaults = {}
+        for key, value in load_config_file(known.config).items():
+            action = actions.get(key)
+            if action is None or action.dest in ('help', 'config'):
+                parser.error(f"unknown option {key!r} in {known.config}")
+            if isinstance(action, argparse._StoreConstAction) and key != action.dest:
+                # Flags: true applies the flag, false keeps the default
+                if value:
+                    defaults[action.dest] = action.const
+                continue
+            defaults[action.dest] = config_value(parser, action, key, value, known.config)
+        parser.set_defaults(**defaults)
+    args = parser.parse_args(argv)
+    if args.resume and not args.journal:
+        parser.error("--resume needs the crawl journal")
+    return args
+
+def main_options(args):
+    """main() keyword arguments for parsed options."""
+    politeness = HostPoliteness(max_in_flight=args.max_in_flight, min_interval=1 / args.rate if args.rate else 0,
+                                max_rate=args.max_rate, max_retries=args.max_retries,
+                                navigation_timeout=args.navigation_timeout, table_timeout=args.table_timeout)
+    return {
+        'provinces': args.provinces, 'what': args.what, 'page_range': args.page_range, 'max_pages': args.max_pages,
+        'backend': args.backend, 'profile': args.profile, 'headless': not args.headed,
+        'max_concurrency': args.max_concurrency, 'page_concurrency': args.page_concurrency,
+        'parse_workers': args.parse_workers, 'politeness': politeness, 'page_pool_size': args.page_pool_size,
+        'recycle_after': args.recycle_after, 'max_rss_mb': args.max_rss_mb,
+        'formats': args.formats, 'output_dir': args.output_dir, 'basename': args.basename, 'analyze': args.analyze,
+        'xlsx_by_province': args.xlsx_by_province, 'dataset_dir': args.dataset, 'dataset_format': args.dataset_format,
+        'company_index_path': args.company_index, 'normalize': args.normalize,
+        'resume': args.resume, 'journal_path': args.journal, 'incremental': args.incremental, 'index_path': args.index,
+        'metrics_path': args.metrics, 'metrics_port': args.metrics_port, 'capture_dir': args.capture,
+    }
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    args = parse_args()
+    if args.list_provinces:
+        print('\n'.join(PROVINCES))
+        raise SystemExit(0)
+    
+    try:
+        asyncio.run(main(**main_options(args)))
+    except KeyboardInterrupt:
+        if args.journal:
+            logger.warning(f"Interrupted; finished pages are kept in {args.journal}, rerun with --resume to continue")
+        else:
+            logger.warning("Interrupted")
@@ -0,0 +1,127 @@
+# Run metrics: per-stage timers and counters, written as a JSON report or served as Prometheus text
+
+import json
+import logging
+import math
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.95)
+PROMETHEUS_PREFIX = 'kemenperin_scraper'
+
+
+def percentile(sorted_values, q):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+
+class RunMetrics:
+    """Durations per stage plus named counters for one run.
+
+    Stages are timed with `timer()` around the hot-path calls (navigation, content,
+    parsing, dedup, exporters); every observation is kept so the report can give
+    exact percentiles. Counters hold pages, rows, bytes, retries and the like; `detail()`
+    adds a named section to the report (e.g. the per-host politeness state).
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.perf_counter()
+        self.durations = {}
+        self.counters = {}
+        self.details = {}
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage, seconds):
+        self.durations.setdefault(stage, []).append(seconds)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def detail(self, name, value):
+        self.details[name] = value
+
+    def stage_summary(self, stage):
+        values = sorted(self.durations[stage])
+        summary = {'count': len(values), 'total': round(sum(values), 6)}
+        for q in QUANTILES:
+            summary[f"p{round(q * 100)}"] = round(percentile(values, q), 6)
+        summary['max'] = round(values[-1], 6)
+        return summary
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        pages = self.counters.get('pages', 0)
+        rows = self.counters.get('rows', 0)
+        return {
+            'elapsed_seconds': round(elapsed, 3),
+            'pages_per_sec': round(pages / elapsed, 3) if elapsed else None,
+            'rows_per_sec': round(rows / elapsed, 3) if elapsed else None,
+            'counters': dict(sorted(self.counters.items())),
+            'stages': {stage: self.stage_summary(stage) for stage in sorted(self.durations)},
+            **self.details,
+        }
+
+    def save(self, filename):
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
+        logger.info(f"Metrics saved to {filename}")
+
+    def log_summary(self):
+        report = self.report()
+        logger.info(f"Throughput: {report['pages_per_sec']} pages/sec, {report['rows_per_sec']} rows/sec "
+                    f"over {report['elapsed_seconds']}s")
+        for stage, summary in report['stages'].items():
+            logger.info(f"  {stage}: n={summary['count']} p50={summary['p50'] * 1000:.1f}ms "
+                        f"p95={summary['p95'] * 1000:.1f}ms total={summary['total']:.2f}s")
+
+    def prometheus_text(self):
+        """Current metrics in the Prometheus text exposition format."""
+        report = self.report()
+        lines = [f"# TYPE {PROMETHEUS_PREFIX}_stage_seconds summary"]
+        for stage, summary in report['stages'].items():
+            for q in QUANTILES:
+                lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds{{stage="{stage}",quantile="{q}"}} '
+                             f'{summary[f"p{round(q * 100)}"]}')
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_sum{{stage="{stage}"}} {summary["total"]}')
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_count{{stage="{stage}"}} {summary["count"]}')
+        for name, value in report['counters'].items():
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name}_total counter")
+            lines.append(f"{PROMETHEUS_PREFIX}_{name}_total {value}")
+        for name in ('elapsed_seconds', 'pages_per_sec', 'rows_per_sec'):
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} gauge")
+            lines.append(f"{PROMETHEUS_PREFIX}_{name} {report[name] or 0}")
+        return '\n'.join(lines) + '\n'
+
+
+async def serve_prometheus(metrics, port, host='127.0.0.1'):
+    """Serve `metrics` at http://host:port/metrics; returns the runner to clean up when the run ends."""
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=metrics.prometheus_text(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Serving Prometheus metrics at http://{host}:{port}/metrics")
+    return runner
+
+
+# Shared by every stage of the run
+METRICS = RunMetrics()
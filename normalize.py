@@ -0,0 +1,123 @@
+# Batched normalization of a run's DataFrame: address parts, phone numbers and KBLI codes as clean columns
+#
+#   python normalize.py good-data/kemenperin_companies_20250801_201911.csv --province Banten -o banten.parquet
+
+import argparse
+import logging
+
+import pandas as pd
+
+from records import read_csv_records
+
+logger = logging.getLogger(__name__)
+
+# Columns added or rewritten by normalize_frame()
+NORMALIZED_COLUMNS = ('village', 'district', 'regency', 'address_province', 'phone_number', 'kbli')
+
+MIN_PHONE_DIGITS = 6  # shorter leftovers ("-", "0") are placeholders, not numbers
+
+# The directory appends "<desa/kelurahan>, <kecamatan>, <Kabupaten|Kota ...>, <province>" to every address
+ADDRESS_TAIL_PATTERN = (r'(?:^|,)\s*(?P<village>[^,]*?)\s*,\s*(?P<district>[^,]*?)\s*,\s*'
+                        r'(?P<regency>(?:[Kk]abupaten|[Kk]ab\.|[Kk]ota)\s[^,]*?)\s*,\s*(?P<address_province>[^,]*?)\s*$')
+REGENCY_PREFIX_PATTERN = r'^(?i:kabupaten|kab\.?)\s+'
+CITY_PREFIX_PATTERN = r'^(?i:kota)\s+'
+# Only the first of "021-5551234 / 0812..." style lists is kept
+PHONE_LIST_PATTERN = r'\s*(?:[/,;]|\s(?i:atau|dan|or)\s).*$'
+PHONE_COUNTRY_PATTERN = r'^\s*\+?\s*62\s*(?:\(0\)\s*)?'
+PHONE_STRIP_PATTERN = r'[^\d*]'
+
+
+def per_distinct(series, func):
+    """`func` applied to the distinct values of `series` only, broadcast back to every row.
+
+    The directory repeats the same regencies, provinces and masked phone numbers on thousands
+    of rows, so the string operations run once per distinct value instead of once per row.
+    """
+    codes, uniques = pd.factorize(series.astype('string').fillna(''))
+    return func(pd.Series(uniques, dtype='string')).iloc[codes].set_axis(series.index)
+
+
+def collapse_spaces(values):
+    return values.str.replace(r'\s+', ' ', regex=True).str.strip()
+
+
+def split_addresses(values):
+    """DataFrame of village, district, regency and address_province parsed from the address tails."""
+    parts = values.str.extract(ADDRESS_TAIL_PATTERN).fillna('')
+    for column in parts.columns:
+        parts[column] = collapse_spaces(parts[column])
+    # Village and district names come both title-cased and in capitals
+    parts['village'] = parts['village'].str.title()
+    parts['district'] = parts['district'].str.title()
+    return parts
+
+
+def normalize_regencies(values):
+    # "Kab. Tangerang", "KABUPATEN  Tangerang" -> "Kabupaten Tangerang"; "kota serang" -> "Kota serang"
+    values = collapse_spaces(values)
+    values = values.str.replace(REGENCY_PREFIX_PATTERN, 'Kabupaten ', regex=True)
+    return values.str.replace(CITY_PREFIX_PATTERN, 'Kota ', regex=True)
+
+
+def normalize_phones(values):
+    """National-format digits of the first listed number: "+62 (0)21-555 1234 / 5" -> "0215551234".
+
+    Masked digits ("081*********") are kept as '*'; placeholders become ''.
+    """
+    values = values.str.replace(PHONE_LIST_PATTERN, '', regex=True)
+    values = values.str.replace(PHONE_COUNTRY_PATTERN, '0', regex=True)
+    values = values.str.replace(PHONE_STRIP_PATTERN, '', regex=True)
+    return values.where(values.str.len() >= MIN_PHONE_DIGITS, '')
+
+
+def normalize_frame(df):
+    """Return `df` with the address split into village (desa/kelurahan), district (kecamatan),
+    regency (kabupaten/kota) and address_province, a `phone_number` column and integer KBLI codes.
+
+    Every column is processed with vectorized string operations over its distinct values.
+    Addresses without the usual tail keep the regency and province the parser found.
+    """
+    if df.empty:
+        return df
+    df = df.copy()
+    parts = per_distinct(df['address'], split_addresses)
+    regency = parts['regency'].where(parts['regency'] != '', df['regency'].astype('string').fillna(''))
+    province = parts['address_province'].where(parts['address_province'] != '',
+                                               df['address_province'].astype('string').fillna(''))
+
+    position = df.columns.get_loc('regency')
+    df.insert(position, 'village', parts['village'])
+    df.insert(position + 1, 'district', parts['district'])
+    df['regency'] = per_distinct(regency, normalize_regencies)
+    df['address_province'] = per_distinct(province, collapse_spaces)
+    df.insert(df.columns.get_loc('phone') + 1, 'phone_number', per_distinct(df['phone'], normalize_phones))
+    df['kbli'] = pd.to_numeric(df['kbli'], errors='coerce').astype('Int32')
+
+    # Grouping columns repeat a lot; store them like create_dataframe() stores text columns
+    for column in ('village', 'district', 'regency', 'address_province', 'phone_number'):
+        df[column] = df[column].astype(object).astype('category')
+    return df
+
+
+def main_cli():
+    from main import create_dataframe
+
+    parser = argparse.ArgumentParser(description="Add normalized address, phone and KBLI columns to CSV exports")
+    parser.add_argument('files', nargs='+', help="CSV exports (current or Column_1..Column_N layout)")
+    parser.add_argument('--province', help="province of rows without one (old exports)")
+    parser.add_argument('-o', '--output', required=True, help="output file: .csv, .parquet or .xlsx")
+    args = parser.parse_args()
+
+    records = [record for path in args.files for record in read_csv_records(path, args.province)]
+    df = normalize_frame(create_dataframe(records))
+    if args.output.endswith('.parquet'):
+        df.to_parquet(args.output, index=False)
+    elif args.output.endswith('.xlsx'):
+        df.to_excel(args.output, index=False)
+    else:
+        df.to_csv(args.output, index=False)
+    logger.info(f"Normalized {len(df)} rows into {args.output}")
+
+
+if __name__ == '__main__':
+    main_cli()
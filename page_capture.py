@@ -0,0 +1,58 @@
+# Capture mode: raw directory page HTML saved per province/page, for offline replay and benchmarks
+
+import json
+import logging
+import os
+import re
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def capture_dirname(province):
+    # Province names become directory names ("DI Yogyakarta" -> "DI_Yogyakarta")
+    return re.sub(r'[^\w.-]+', '_', province).strip('_') or 'listing'
+
+
+class PageCapture:
+    """Writes every fetched page to `<directory>/<province>/<page>.html`.
+
+    manifest.json maps each province to its listing URL and each page number to its
+    file and URL; it is rewritten on close() so an interrupted capture keeps the pages
+    it saved (without being listed).
+    """
+
+    def __init__(self, directory, base_url=None):
+        self.directory = directory
+        self.base_url = base_url
+        self.listings = {}
+        self.pages = 0
+        os.makedirs(directory, exist_ok=True)
+        existing = os.path.join(directory, MANIFEST_NAME)
+        if os.path.exists(existing):
+            # Capturing into the same directory again adds to (and overwrites pages of) the earlier capture
+            self.listings = load_manifest(directory)['listings']
+
+    def record_page(self, province, listing_url, page_number, url, html):
+        folder = capture_dirname(province)
+        os.makedirs(os.path.join(self.directory, folder), exist_ok=True)
+        relative = f"{folder}/{page_number:05d}.html"
+        with open(os.path.join(self.directory, relative), 'w', encoding='utf-8') as f:
+            f.write(html)
+        listing = self.listings.setdefault(province, {'url': listing_url, 'pages': {}})
+        listing['url'] = listing_url
+        listing['pages'][str(page_number)] = {'file': relative, 'url': url}
+        self.pages += 1
+
+    def close(self):
+        manifest = {'created_at': datetime.now().isoformat(), 'base_url': self.base_url, 'listings': self.listings}
+        with open(os.path.join(self.directory, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        logger.info(f"Captured {self.pages} pages to {self.directory}")
+
+
+def load_manifest(directory):
+    with open(os.path.join(directory, MANIFEST_NAME), encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,252 @@
+# Warm browser pages shared by the crawl workers, recycled after heavy use and replaced when they crash
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+RECYCLE_NAVIGATIONS = 250    # a page (and its context) is replaced after this many navigations
+RECYCLE_RSS_MB = 2048        # ... or while the scraper and its browser use more memory than this (needs psutil)
+RSS_CHECK_INTERVAL = 10.0    # seconds between memory checks
+HEALTH_CHECK_TIMEOUT = 5.0   # seconds for a page to answer after a failed navigation
+
+
+def process_tree_rss_mb():
+    """Resident memory of this process and its children (the browser processes) in MB, or None without psutil."""
+    try:
+        import psutil
+    except ImportError:
+        return None
+    process = psutil.Process()
+    total = 0
+    for member in (process, *process.children(recursive=True)):
+        try:
+            total += member.memory_info().rss
+        except psutil.Error:
+            pass
+    return total / 2 ** 20
+
+
+async def is_healthy(page):
+    # A crashed or closed Playwright page can't evaluate anything; pages of the http backend have no renderer
+    is_closed = getattr(page, 'is_closed', None)
+    if is_closed and is_closed():
+        return False
+    evaluate = getattr(page, 'evaluate', None)
+    if evaluate is None:
+        return True
+    try:
+        await asyncio.wait_for(evaluate('1'), HEALTH_CHECK_TIMEOUT)
+        return True
+    except Exception:
+        return False
+
+
+class PooledPage:
+    __slots__ = ('context', 'page', 'navigations', 'opened')
+
+    def __init__(self, context, page):
+        self.context = context
+        self.page = page
+        self.navigations = 0
+        self.opened = time.perf_counter()
+
+
+class PagePool:
+    """Fixed number of warm pages handed out to workers, one navigation per lease.
+
+    Every page gets its own context from `new_context()`, so recycling a page also drops
+    its renderer's memory; `for_context()` makes a pool of pages in one existing context.
+    `start()` opens the pages in the background and the first lease is served as soon
+    as one page is ready, so warm-up overlaps with the first fetches.
+
+    A page is closed and replaced after `recycle_after` navigations, when the process
+    tree's RSS is above `max_rss_mb` (checked every RSS_CHECK_INTERVAL seconds, one page
+    per check), or when it fails a health check after a failed navigation. `stats()`
+    reports how busy the pool was, for sizing it.
+    """
+
+    def __init__(self, new_context, size, recycle_after=RECYCLE_NAVIGATIONS, max_rss_mb=RECYCLE_RSS_MB,
+                 owns_contexts=True):
+        self.new_context = new_context
+        self.size = max(1, size)
+        self.recycle_after = recycle_after
+        self.max_rss_mb = max_rss_mb
+        self.owns_contexts = owns_contexts
+        self._idle = asyncio.Queue()
+        self._leased = {}
+        self._opening = set()
+        self._started = None
+        self._closed = False
+        self._next_rss_check = 0.0
+        self.open_pages = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.leases = 0
+        self.navigations = 0
+        self.recycled = 0
+        self.replaced = 0
+        self.wait_seconds = 0.0
+        self.busy_seconds = 0.0
+
+    @classmethod
+    def for_context(cls, context, size, **kwargs):
+        async def shared_context():
+            return context
+        return cls(shared_context, size, owns_contexts=False, **kwargs)
+
+    def start(self):
+        """Start opening the pages; leases wait only until the first one is ready."""
+        if self._started is None:
+            self._started = time.perf_counter()
+            for _ in range(self.size):
+                self._open_later()
+        return self
+
+    def _open_later(self):
+        task = asyncio.create_task(self._open())
+        self._opening.add(task)
+        task.add_done_callback(self._opening.discard)
+
+    async def _open(self):
+        try:
+            with METRICS.timer('page_open'):
+                context = await self.new_context()
+                page = await context.new_page()
+        except Exception as e:
+            # Handed to the next lease, which raises it and tries again with a fresh page
+            logger.warning(f"Could not open a pooled page: {e}")
+            self._idle.put_nowait(e)
+            return
+        self.open_pages += 1
+        self._idle.put_nowait(PooledPage(context if self.owns_contexts else None, page))
+
+    async def _close(self, slot):
+        self.open_pages -= 1
+        try:
+            await slot.page.close()
+            if slot.context:
+                await slot.context.close()
+        except Exception as e:
+            logger.debug(f"Closing a pooled page failed: {e}")
+
+    async def acquire(self):
+        """Lease a page; give it back with `release()`."""
+        if self._closed:
+            raise RuntimeError("Page pool is closed")
+        self.start()
+        while True:
+            waited = time.perf_counter()
+            slot = await self._idle.get()
+            wait = time.perf_counter() - waited
+            self.wait_seconds += wait
+            METRICS.observe('page_pool_wait', wait)
+            if isinstance(slot, Exception):
+                self._open_later()
+                raise slot
+            is_closed = getattr(slot.page, 'is_closed', None)
+            if not (is_closed and is_closed()):
+                break
+            logger.warning("Pooled page was closed (crashed renderer?), replacing it")
+            self.replaced += 1
+            METRICS.count('pages_replaced')
+            self._open_later()
+            await self._close(slot)
+
+        self.leases += 1
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        self._leased[id(slot.page)] = (slot, time.perf_counter())
+        return slot.page
+
+    async def release(self, page, navigations=1, failed=False):
+        """Return a leased page after `navigations` page loads; a `failed` lease gets a health check."""
+        slot, leased_at = self._leased.pop(id(page))
+        self.in_use -= 1
+        self.busy_seconds += time.perf_counter() - leased_at
+        slot.navigations += navigations
+        self.navigations += navigations
+
+        if self._closed:
+            await self._close(slot)
+            return
+        if failed and not await is_healthy(page):
+            logger.warning("Pooled page failed its health check, replacing it")
+            self.replaced += 1
+            METRICS.count('pages_replaced')
+        elif slot.navigations >= self.recycle_after:
+            self.recycled += 1
+            METRICS.count('pages_recycled')
+        elif self._over_memory():
+            logger.info(f"Process RSS above {self.max_rss_mb} MB, recycling a pooled page")
+            self.recycled += 1
+            METRICS.count('pages_recycled')
+        else:
+            self._idle.put_nowait(slot)
+            return
+        # The replacement warms up while the old page closes
+        self._open_later()
+        await self._close(slot)
+
+    def _over_memory(self):
+        if not self.max_rss_mb or time.perf_counter() < self._next_rss_check:
+            return False
+        self._next_rss_check = time.perf_counter() + RSS_CHECK_INTERVAL
+        rss = process_tree_rss_mb()
+        if rss is None:
+            # No psutil: only the navigation limit applies
+            self.max_rss_mb = None
+            logger.info("psutil is not installed; pooled pages are recycled by navigation count only")
+            return False
+        return rss > self.max_rss_mb
+
+    @asynccontextmanager
+    async def page(self):
+        """Lease a page for one navigation."""
+        page = await self.acquire()
+        try:
+            yield page
+        except asyncio.CancelledError:
+            await self.release(page)
+            raise
+        except Exception:
+            await self.release(page, failed=True)
+            raise
+        await self.release(page)
+
+    def stats(self):
+        elapsed = time.perf_counter() - self._started if self._started else 0
+        return {
+            'size': self.size,
+            'open_pages': self.open_pages,
+            'in_use': self.in_use,
+            'peak_in_use': self.peak_in_use,
+            'leases': self.leases,
+            'navigations': self.navigations,
+            'recycled': self.recycled,
+            'replaced': self.replaced,
+            'wait_seconds': round(self.wait_seconds, 3),
+            'utilization': round(self.busy_seconds / (self.size * elapsed), 3) if elapsed else None,
+        }
+
+    def log_summary(self):
+        stats = self.stats()
+        utilization = f"{stats['utilization']:.0%}" if stats['utilization'] is not None else "n/a"
+        logger.info(f"Page pool: {stats['size']} pages, peak {stats['peak_in_use']} in use, {utilization} utilized, "
+                    f"{stats['leases']} leases waited {stats['wait_seconds']}s in total, "
+                    f"{stats['recycled']} recycled, {stats['replaced']} replaced")
+
+    async def close(self):
+        """Close the idle pages now; pages still leased are closed when released."""
+        self._closed = True
+        for task in list(self._opening):
+            task.cancel()
+        await asyncio.gather(*self._opening, return_exceptions=True)
+        while not self._idle.empty():
+            slot = self._idle.get_nowait()
+            if isinstance(slot, PooledPage):
+                await self._close(slot)
@@ -0,0 +1,61 @@
+# Parsing stage off the event loop: raw page HTML goes through a bounded queue to a pool of parser processes
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import table_parser
+
+logger = logging.getLogger(__name__)
+
+# Leave a core for the event loop and the browser; single-core machines parse inline
+PARSE_WORKERS = max(0, (os.cpu_count() or 1) - 1)
+PARSE_QUEUE_SIZE = 32  # pages handed to the pool but not yet parsed
+
+
+class ParsePool:
+    """Process pool running table_parser on raw HTML with back-pressure.
+
+    At most `max_pending` pages are queued for or inside the workers; further calls wait
+    for room, so fetchers slow down when parsing falls behind instead of piling up HTML.
+    `workers=0` parses inline on the event loop (the behaviour without a pool).
+    """
+
+    def __init__(self, workers=PARSE_WORKERS, max_pending=PARSE_QUEUE_SIZE):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = asyncio.Semaphore(max_pending)
+        self._executor = None
+        self.parsed = 0
+
+    def start(self):
+        """Start the worker processes now rather than on the first page.
+
+        Called before the browser is launched, so forked workers don't inherit its threads.
+        """
+        if self.workers and self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers)
+            self._executor.submit(table_parser.parse_rows, '').result()
+            logger.info(f"Started {self.workers} parser processes")
+        return self
+
+    async def run(self, func, html, *args):
+        async with self._slots:
+            if not self.workers:
+                result = func(html, *args)
+            else:
+                result = await asyncio.get_running_loop().run_in_executor(self.start()._executor, func, html, *args)
+        self.parsed += 1
+        return result
+
+    async def parse_page(self, html, province=None):
+        return await self.run(table_parser.parse_page, html, province)
+
+    async def parse_rows(self, html, province=None):
+        return await self.run(table_parser.parse_rows, html, province)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
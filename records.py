@@ -0,0 +1,150 @@
+# Typed company record: one slotted object per directory listing, with stable field names
+
+import csv
+import re
+
+# Output columns, in order; every writer and the DataFrame use these names
+COLUMNS = ('number', 'legal_form', 'name', 'address', 'regency', 'address_province', 'phone', 'kbli', 'province')
+
+# Legal-form prefixes seen on the directory (PR = perusahaan rokok, KO = koperasi, ...)
+LEGAL_FORMS = frozenset({'PT', 'CV', 'PR', 'UD', 'KO', 'PD', 'FA', 'BUL', 'BUT', 'BHL', 'PUD', 'PERUM', 'PRD',
+                         'KOPERASI'})
+
+NUMBER_PATTERN = re.compile(r'^(\d+)\.?$')
+KBLI_PATTERN = re.compile(r'^[1-9]\d{0,4}$')
+PHONE_PREFIX_PATTERN = re.compile(r'^(?:telp|phone)\.?:?\s*', re.IGNORECASE)
+REGENCY_PATTERN = re.compile(r'^(?:Kabupaten|Kab\.|Kota)\s', re.IGNORECASE)
+
+
+def split_legal_form(full_name):
+    """Split "PT  Warisan Eurindo" into ('PT', 'Warisan Eurindo'); names without a known prefix keep it ''."""
+    first, _, rest = full_name.partition(' ')
+    form = first.rstrip('.').upper()
+    if form in LEGAL_FORMS and rest.strip():
+        return form, rest.strip()
+    return '', full_name
+
+
+def split_address(address):
+    # "..., Dalung, Kuta Utara, Kabupaten Badung, Bali" -> ('Kabupaten Badung', 'Bali')
+    parts = [part.strip() for part in address.split(',')]
+    if len(parts) >= 2 and REGENCY_PATTERN.match(parts[-2]):
+        return parts[-2], parts[-1]
+    return '', ''
+
+
+def is_record_row(row):
+    # Rows stored by to_row() rather than in the old Column_1..Column_N layout
+    return len(row) == len(COLUMNS) and isinstance(row[0], int)
+
+
+class CompanyRecord:
+    """One company listing.
+
+    `number` is the listing number, `kbli` the listing's KBLI code (companies with several
+    codes are listed once per code), `province` the directory province it was scraped from;
+    `regency` and `address_province` are the trailing parts of the address.
+    """
+
+    __slots__ = COLUMNS
+
+    def __init__(self, number, legal_form, name, address, regency='', address_province='', phone='', kbli=None,
+                 province=None):
+        self.number = number
+        self.legal_form = legal_form
+        self.name = name
+        self.address = address
+        self.regency = regency
+        self.address_province = address_province
+        self.phone = phone
+        self.kbli = kbli
+        self.province = province
+
+    @classmethod
+    def from_segments(cls, segments, province=None):
+        """Build a record from a table row's <br>-separated text segments, or None for non-company rows.
+
+        The first two segments are the number and the name, a trailing bare code is the KBLI, a
+        "Telp." segment is the phone and anything else is address.
+        """
+        if len(segments) < 2:
+            return None
+        match = NUMBER_PATTERN.match(segments[0])
+        if not match:
+            return None
+
+        # The KBLI code sits in the row's last cell, after the name/address/phone cell
+        details = segments[2:]
+        kbli = None
+        if details and KBLI_PATTERN.match(details[-1]):
+            kbli = int(details.pop())
+
+        address_parts = []
+        phone = ''
+        for segment in details:
+            if PHONE_PREFIX_PATTERN.match(segment):
+                phone = phone or PHONE_PREFIX_PATTERN.sub('', segment, count=1)
+            elif not phone and segment[:1] in ('0', '+'):
+                phone = segment
+            else:
+                address_parts.append(segment)
+
+        legal_form, name = split_legal_form(segments[1])
+        address = ', '.join(address_parts)
+        regency, address_province = split_address(address)
+        return cls(int(match.group(1)), legal_form, name, address, regency, address_province, phone, kbli, province)
+
+    @classmethod
+    def from_legacy_row(cls, row, province=None):
+        """Convert a row of the old Column_1..Column_N layout (good-data exports, old journals)."""
+        return cls.from_segments([str(cell).strip() for cell in row if str(cell).strip()], province)
+
+    @classmethod
+    def from_row(cls, row, province=None):
+        """Inverse of to_row(); rows stored in the old layout are converted (None for their header rows)."""
+        if is_record_row(row):
+            return cls(*row)
+        return cls.from_legacy_row(row, province)
+
+    @property
+    def full_name(self):
+        return f"{self.legal_form} {self.name}" if self.legal_form else self.name
+
+    def to_row(self):
+        return [self.number, self.legal_form, self.name, self.address, self.regency, self.address_province,
+                self.phone, self.kbli, self.province]
+
+    def to_dict(self):
+        return dict(zip(COLUMNS, self.to_row()))
+
+    def key(self):
+        # Identity for dedup: every field of the listing itself, not where it was scraped from
+        return f"{self.number}\x1f{self.full_name}\x1f{self.address}\x1f{self.phone}\x1f{self.kbli}"
+
+    def __eq__(self, other):
+        return isinstance(other, CompanyRecord) and self.to_row() == other.to_row()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"CompanyRecord({', '.join(f'{name}={value!r}' for name, value in self.to_dict().items())})"
+
+
+def read_csv_records(path, province=None):
+    """Yield the CompanyRecords of a CSV export, in the current layout or the old Column_1..Column_N one.
+
+    `province` fills in rows without one (old exports).
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        current_layout = header == list(COLUMNS)
+        for row in reader:
+            if current_layout:
+                number, legal_form, name, address, regency, address_province, phone, kbli, row_province = row
+                record = CompanyRecord(int(number), legal_form, name, address, regency, address_province, phone,
+                                       int(kbli) if kbli else None, row_province or province)
+            else:
+                record = CompanyRecord.from_legacy_row(row, province)
+            if record is not None:
+                yield record
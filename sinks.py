@@ -0,0 +1,276 @@
+# Streaming output pipeline: rows flow page by page through dedup into pluggable file writers
+
+import csv
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+from urllib.parse import quote
+
+from metrics import METRICS
+from records import COLUMNS
+
+logger = logging.getLogger(__name__)
+
+PARQUET_BATCH_ROWS = 50000
+PARQUET_TYPES = {'number': 'int64', 'kbli': 'int32'}
+DATASET_FORMATS = ('parquet', 'arrow')
+KBLI_PREFIX_DIGITS = 2  # KBLI division ("golongan pokok"), e.g. 31 for furniture
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'  # read back as null by pyarrow.dataset
+
+
+def import_pyarrow():
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise ImportError("Parquet/Arrow output requires pyarrow (pip install pyarrow)") from e
+    return pa
+
+
+def record_schema(pa):
+    """The Arrow schema of a CompanyRecord; the same for every file and every run."""
+    return pa.schema([(name, PARQUET_TYPES.get(name, 'string')) for name in COLUMNS])
+
+
+def record_table(pa, schema, rows):
+    # to_row() lists -> Arrow table, built column by column
+    columns = list(zip(*rows))
+    return pa.Table.from_arrays([pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                                schema=schema)
+
+
+def sink_name(sink):
+    # Metrics label: the output format for file writers, the class name otherwise
+    filename = getattr(sink, 'filename', None)
+    if filename:
+        return os.path.splitext(filename)[1].lstrip('.')
+    return getattr(sink, 'name', None) or type(sink).__name__
+
+
+class DedupStage:
+    """Drops records already seen in this run.
+
+    Records are compared on CompanyRecord.key() (the listing's own fields, not the
+    province it was scraped from); only a 16-byte digest per record is kept.
+    """
+
+    def __init__(self):
+        self._seen = set()
+        self.duplicates = 0
+
+    def filter(self, records):
+        for record in records:
+            key = hashlib.blake2b(record.key().encode('utf-8'), digest_size=16).digest()
+            if key in self._seen:
+                self.duplicates += 1
+                continue
+            self._seen.add(key)
+            yield record
+
+
+class NdjsonSink:
+    """One JSON object per line, written as records arrive."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.count = 0
+        self._file = open(filename, 'w', encoding='utf-8')
+
+    def write(self, record, province=None):
+        self._file.write(json.dumps(record.to_dict(), ensure_ascii=False) + '\n')
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+        logger.info(f"Data saved to {self.filename} ({self.count} records)")
+
+
+class CsvSink:
+    """CSV with the COLUMNS header, written as records arrive; missing values are empty cells."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.count = 0
+        self._file = open(filename, 'w', encoding='utf-8', newline='')
+        self._writer = csv.writer(self._file, lineterminator='\n')
+        self._writer.writerow(COLUMNS)
+
+    def write(self, record, province=None):
+        self._writer.writerow(record.to_row())
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+        logger.info(f"Data saved to {self.filename} ({self.count} rows)")
+
+
+class JsonSink:
+    """JSON array of records, one record per line instead of indented."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.count = 0
+        self._file = open(filename, 'w', encoding='utf-8')
+        self._file.write('[')
+
+    def write(self, record, province=None):
+        self._file.write(',\n' if self.count else '\n')
+        self._file.write(json.dumps(record.to_dict(), ensure_ascii=False))
+        self.count += 1
+
+    def close(self):
+        self._file.write('\n]\n' if self.count else ']\n')
+        self._file.close()
+        logger.info(f"Data saved to {self.filename} ({self.count} records)")
+
+
+class ParquetSink:
+    """Typed Parquet (integer number and KBLI, string fields), written in row groups of PARQUET_BATCH_ROWS."""
+
+    def __init__(self, filename):
+        self._pa = import_pyarrow()
+        import pyarrow.parquet as pq
+
+        self.filename = filename
+        self.count = 0
+        self._schema = record_schema(self._pa)
+        self._writer = pq.ParquetWriter(filename, self._schema, compression='zstd')
+        self._batch = []
+
+    def write(self, record, province=None):
+        self._batch.append(record.to_row())
+        self.count += 1
+        if len(self._batch) >= PARQUET_BATCH_ROWS:
+            self._flush()
+
+    def _flush(self):
+        self._writer.write_table(record_table(self._pa, self._schema, self._batch))
+        self._batch = []
+
+    def close(self):
+        if self._batch:
+            self._flush()
+        self._writer.close()
+        logger.info(f"Data saved to {self.filename} ({self.count} rows)")
+
+
+def kbli_prefix(kbli):
+    return str(kbli)[:KBLI_PREFIX_DIGITS] if kbli is not None else None
+
+
+def partition_dir(province, prefix):
+    # Hive-style directories, URI-encoded the way pyarrow.dataset decodes them
+    values = [('province', province), ('kbli_prefix', prefix)]
+    return os.path.join(*(f"{key}={quote(value, safe='') if value else NULL_PARTITION}" for key, value in values))
+
+
+class DatasetSink:
+    """Columnar dataset partitioned by province and KBLI prefix.
+
+    `<directory>/province=Bali/kbli_prefix=31/part-<run_id>-00000.parquet` (or `.arrow`, Arrow
+    IPC files that can be memory-mapped). Every run writes new part files under its own
+    run id and never touches existing ones, so repeated runs add to the dataset; read it with
+    `pyarrow.dataset.dataset(directory, format=..., partitioning='hive')`. Records are
+    buffered per partition and flushed every PARQUET_BATCH_ROWS.
+    """
+
+    name = 'dataset'
+
+    def __init__(self, directory, fmt='parquet', run_id=None):
+        if fmt not in DATASET_FORMATS:
+            raise ValueError(f"Unknown dataset format {fmt!r} (expected one of {', '.join(DATASET_FORMATS)})")
+        self.directory = directory
+        self.format = fmt
+        self.run_id = run_id or datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.count = 0
+        self.files = []
+        self._pa = import_pyarrow()
+        self._schema = record_schema(self._pa)
+        self._batches = {}
+
+    def write(self, record, province=None):
+        partition = (record.province or province, kbli_prefix(record.kbli))
+        batch = self._batches.setdefault(partition, [])
+        batch.append(record.to_row())
+        self.count += 1
+        if len(batch) >= PARQUET_BATCH_ROWS:
+            self._flush(partition)
+
+    def _flush(self, partition):
+        rows = self._batches.pop(partition)
+        folder = os.path.join(self.directory, partition_dir(*partition))
+        os.makedirs(folder, exist_ok=True)
+        sequence = sum(1 for name in self.files if os.path.dirname(name) == folder)
+        filename = os.path.join(folder, f"part-{self.run_id}-{sequence:05d}.{self.format}")
+        table = record_table(self._pa, self._schema, rows)
+        if self.format == 'parquet':
+            import pyarrow.parquet as pq
+            pq.write_table(table, filename, compression='zstd')
+        else:
+            # Uncompressed, so readers can memory-map the file without a copy
+            with self._pa.OSFile(filename, 'wb') as sink, self._pa.ipc.new_file(sink, self._schema) as writer:
+                writer.write_table(table)
+        self.files.append(filename)
+
+    def close(self):
+        for partition in list(self._batches):
+            self._flush(partition)
+        logger.info(f"Data saved to {self.directory} ({self.count} rows in {len(self.files)} {self.format} files)")
+
+
+class CollectSink:
+    """Keeps records in memory for stages that need a DataFrame (xlsx, analysis)."""
+
+    def __init__(self):
+        self.rows = []
+
+    def write(self, record, province=None):
+        self.rows.append(record)
+
+    def close(self):
+        pass
+
+
+STREAM_SINKS = {
+    'csv': CsvSink,
+    'json': JsonSink,
+    'ndjson': NdjsonSink,
+    'parquet': ParquetSink,
+}
+
+
+def open_sinks(formats, basename):
+    """Create a sink per streamable format, writing to `<basename>.<format>`."""
+    return [STREAM_SINKS[fmt](f"{basename}.{fmt}") for fmt in formats if fmt in STREAM_SINKS]
+
+
+class RowPipeline:
+    """Parser output -> dedup -> every sink, one page of records at a time."""
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+        self.dedup = DedupStage()
+        self.rows_in = 0
+        self.rows_out = 0
+
+    def write(self, rows, province=None):
+        self.rows_in += len(rows)
+        with METRICS.timer('dedup'):
+            unique = list(self.dedup.filter(rows))
+        self.rows_out += len(unique)
+        for sink in self.sinks:
+            with METRICS.timer(f"write.{sink_name(sink)}"):
+                for row in unique:
+                    sink.write(row, province)
+
+    def close(self):
+        logger.info(f"Removed {self.dedup.duplicates} duplicate rows ({self.rows_out} unique of {self.rows_in})")
+        METRICS.count('duplicates', self.dedup.duplicates)
+        for sink in self.sinks:
+            try:
+                with METRICS.timer(f"export.{sink_name(sink)}"):
+                    sink.close()
+            except Exception as e:
+                target = getattr(sink, 'filename', None) or getattr(sink, 'directory', 'output')
+                logger.error(f"Error saving {target}: {e}")
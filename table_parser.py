@@ -0,0 +1,169 @@
+# Single-pass lxml parser for Kemenperin directory pages (#newspaper-a table and pagination)
+
+import logging
+import re
+
+import lxml.html
+
+from records import CompanyRecord
+
+logger = logging.getLogger(__name__)
+
+PAGE_NUMBER_PATTERN = re.compile(r'^(\d+)')
+PAGINATION_XPATH = "//ul[contains(concat(' ', normalize-space(@class), ' '), ' pagination ')]"
+
+
+def summarize_pagination(links):
+    """Build the pagination info dict from (text, href, is_active) tuples of the widget's links."""
+    pages = []
+    current_page = 1
+    max_visible_page = 1
+    has_more_pages = False
+    seen_page_numbers = set()
+
+    for text, href, is_active in links:
+        # Extract page number from text that might contain dots
+        match = PAGE_NUMBER_PATTERN.match(text)
+        if not match:
+            # Text is not a number (e.g., "Next", "Previous")
+            pages.append({'text': text, 'href': href, 'is_active': is_active,
+                          'page_number': None, 'has_dots': False})
+            continue
+
+        page_number = int(match.group(1))
+        if is_active:
+            current_page = page_number
+        max_visible_page = max(max_visible_page, page_number)
+        has_dots = '..' in text
+        has_more_pages = has_more_pages or has_dots
+
+        # Remove duplicates
+        if page_number not in seen_page_numbers:
+            seen_page_numbers.add(page_number)
+            pages.append({'text': text, 'href': href, 'is_active': is_active,
+                          'page_number': page_number, 'has_dots': has_dots})
+
+    page_numbers = sorted(seen_page_numbers)
+    logger.info(f"Found page numbers: {page_numbers if page_numbers else 'None'}")
+    logger.info(f"Current page: {current_page}, Max visible: {max_visible_page}, Has more: {has_more_pages}")
+
+    return {
+        'current_page': current_page,
+        'pages': pages,
+        'max_visible_page': max_visible_page,
+        'has_more_pages': has_more_pages,
+        'page_numbers': page_numbers,
+    }
+
+
+def _text(element):
+    # Equivalent of BeautifulSoup's get_text(strip=True): stripped text nodes, comments skipped
+    parts = []
+
+    def walk(el):
+        if isinstance(el.tag, str) and el.text:
+            parts.append(el.text.strip())
+        for child in el:
+            walk(child)
+            if child.tail:
+                parts.append(child.tail.strip())
+
+    walk(element)
+    return ''.join(parts)
+
+
+def _cell_segments(cell, segments):
+    # Split the cell's text on <br> straight from the tree and append the non-empty pieces
+    current = []
+
+    def flush():
+        segment = ''.join(current).strip()
+        if segment:
+            segments.append(segment)
+        current.clear()
+
+    def walk(el):
+        if el.tag == 'br':
+            flush()
+        elif isinstance(el.tag, str) and el.text:
+            current.append(el.text)
+        for child in el:
+            walk(child)
+            if child.tail:
+                current.append(child.tail)
+
+    walk(cell)
+    flush()
+
+
+def _document(html):
+    if not html or not html.strip():
+        return None
+    if html.lstrip().startswith('<?xml'):
+        html = html.encode('utf-8')
+    return lxml.html.document_fromstring(html)
+
+
+def parse_table_rows(doc, province=None):
+    """Extract a CompanyRecord per listing from the #newspaper-a table of a parsed document.
+
+    Header and other non-company rows are skipped.
+    """
+    tables = doc.xpath("//table[@id='newspaper-a']")
+    if not tables:
+        logger.warning("Table not found on page")
+        return []
+
+    records = []
+    for row in tables[0].iter('tr'):
+        cells = list(row.iter('td', 'th'))
+        if not cells:
+            continue
+
+        # Rows with bgcolor="white" and valign="top" hold BR-separated company details
+        segments = []
+        if row.get('bgcolor') == 'white' and row.get('valign') == 'top':
+            for cell in cells:
+                _cell_segments(cell, segments)
+        else:
+            segments = [text for text in (_text(cell) for cell in cells) if text]
+
+        record = CompanyRecord.from_segments(segments, province)
+        if record is not None:
+            records.append(record)
+
+    logger.info(f"Extracted {len(records)} records from current page")
+    return records
+
+
+def parse_pagination_links(doc):
+    """Return the pagination info dict of a parsed document, or None without a widget."""
+    widgets = doc.xpath(PAGINATION_XPATH)
+    if not widgets:
+        return None
+
+    links = []
+    for li in widgets[0].iter('li'):
+        is_active = 'active' in (li.get('class') or '').split()
+        for link in li.iter('a'):
+            links.append((_text(link), link.get('href', ''), is_active))
+    return summarize_pagination(links)
+
+
+def parse_page(html, province=None):
+    """Parse a directory page once and return (records, pagination_info)."""
+    doc = _document(html)
+    if doc is None:
+        logger.warning("Empty page content")
+        return [], None
+    return parse_table_rows(doc, province), parse_pagination_links(doc)
+
+
+def parse_rows(html, province=None):
+    doc = _document(html)
+    return parse_table_rows(doc, province) if doc is not None else []
+
+
+def parse_pagination(html):
+    doc = _document(html)
+    return parse_pagination_links(doc) if doc is not None else None
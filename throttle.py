@@ -0,0 +1,214 @@
+# Per-host politeness: adaptive token-bucket rate, in-flight cap, retry/backoff policy and circuit breaker
+
+import asyncio
+import logging
+import random
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Defaults shared by every worker hitting the same host
+PER_HOST_CONCURRENCY = 4     # navigations in flight per host
+INITIAL_RATE = 2.0           # requests/sec per host to start with
+MIN_RATE = 0.2               # never slower than this
+MAX_RATE = 8.0               # never faster than this
+TARGET_LATENCY = 5.0         # seconds; slower responses make the limiter back off
+MAX_RETRIES = 3              # retries per navigation after the first attempt
+BACKOFF_BASE = 1.0           # seconds, doubled per attempt
+BACKOFF_MAX = 30.0
+BREAKER_THRESHOLD = 5        # consecutive failures that open a host's circuit
+BREAKER_RESET = 30.0         # seconds a circuit stays open before requests probe again
+PROBE_POLL = 0.05            # seconds between checks while a half-open circuit's probe is in flight
+NAVIGATION_TIMEOUT = 60.0    # seconds for a page load (goto and load-state waits)
+TABLE_TIMEOUT = 40.0         # seconds to wait for #newspaper-a once the page has loaded
+
+
+class AdaptiveRateLimiter:
+    """Token bucket whose rate follows the server: additive increase, multiplicative decrease.
+
+    Successes faster than `target_latency` raise the rate a little; errors halve it and
+    slow responses trim it, within [min_rate, max_rate]. `rate=None` disables limiting.
+    """
+
+    def __init__(self, rate=INITIAL_RATE, min_rate=MIN_RATE, max_rate=MAX_RATE, target_latency=TARGET_LATENCY,
+                 burst=1.0):
+        self.rate = rate
+        self.min_rate = min(min_rate, rate) if rate else min_rate
+        self.max_rate = max(max_rate, rate) if rate else max_rate
+        self.target_latency = target_latency
+        self.burst = burst
+        self.latency = None  # exponentially weighted moving average
+        self._tokens = burst
+        self._updated = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.rate:
+            return
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self._updated is not None:
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def record(self, latency, ok):
+        if not self.rate:
+            return
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        if not ok:
+            self.rate = max(self.min_rate, self.rate * 0.5)
+        elif self.latency > self.target_latency:
+            self.rate = max(self.min_rate, self.rate * 0.9)
+        else:
+            self.rate = min(self.max_rate, self.rate + 0.1)
+
+
+class CircuitBreaker:
+    """Stops traffic to a host after repeated failures.
+
+    After `threshold` consecutive failures the circuit opens and requests wait out
+    `reset_timeout`; then a single request is let through as a probe (the others keep
+    waiting) whose failure reopens it at once and whose success closes it.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_timeout=BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.trips = 0
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if asyncio.get_running_loop().time() - self.opened_at < self.reset_timeout:
+            return 'open'
+        return 'half-open'
+
+    async def wait(self):
+        """Wait until a request may go out; True if it is the half-open circuit's probe."""
+        while True:
+            state = self.state
+            if state == 'closed':
+                return False
+            if state == 'half-open' and not self.probing:
+                self.probing = True
+                return True
+            if state == 'open':
+                remaining = self.opened_at + self.reset_timeout - asyncio.get_running_loop().time()
+                await asyncio.sleep(max(remaining, 0.01))
+            else:
+                await asyncio.sleep(PROBE_POLL)
+
+    def record(self, ok):
+        self.probing = False
+        if ok:
+            self.failures = 0
+            self.opened_at = None
+            return
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.threshold:
+            if self.opened_at is None:
+                self.trips += 1
+                METRICS.count('breaker_trips')
+                logger.warning(f"{self.failures} failures in a row, pausing requests for {self.reset_timeout:.0f}s")
+            self.opened_at = asyncio.get_running_loop().time()
+
+
+class HostPoliteness:
+    """Per-host budget shared by all workers.
+
+    Each host gets an adaptive rate limiter, a cap on in-flight navigations and a
+    circuit breaker; the retry policy (max_retries + jittered exponential backoff)
+    and the page-load timeouts (seconds) are applied by the caller around `slot()`.
+    `min_interval` sets the starting rate (0 disables rate limiting).
+    """
+
+    def __init__(self, max_in_flight=PER_HOST_CONCURRENCY, min_interval=1 / INITIAL_RATE, max_rate=MAX_RATE,
+                 min_rate=MIN_RATE, target_latency=TARGET_LATENCY, max_retries=MAX_RETRIES,
+                 backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX, breaker_threshold=BREAKER_THRESHOLD,
+                 breaker_reset=BREAKER_RESET, navigation_timeout=NAVIGATION_TIMEOUT, table_timeout=TABLE_TIMEOUT):
+        self.max_in_flight = max_in_flight
+        self.min_interval = min_interval
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.navigation_timeout = navigation_timeout
+        self.table_timeout = table_timeout
+        self._hosts = {}
+        self.retries = 0
+
+    def _host(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._hosts:
+            rate = 1 / self.min_interval if self.min_interval else None
+            self._hosts[host] = {
+                'semaphore': asyncio.Semaphore(self.max_in_flight),
+                'limiter': AdaptiveRateLimiter(rate, self.min_rate, self.max_rate, self.target_latency),
+                'breaker': CircuitBreaker(self.breaker_threshold, self.breaker_reset),
+            }
+        return self._hosts[host]
+
+    def backoff_delay(self, attempt):
+        # Full jitter: uniform in [0, min(max, base * 2^attempt)]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    @asynccontextmanager
+    async def slot(self, url):
+        host = self._host(url)
+        breaker = host['breaker']
+        async with host['semaphore']:
+            # Checked after the semaphore and the rate limiter, so requests queued behind them
+            # don't go out after the circuit opened while they waited
+            while True:
+                probe = await breaker.wait()
+                await host['limiter'].acquire()
+                if probe or breaker.state == 'closed':
+                    break
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            try:
+                yield
+            except Exception:
+                host['limiter'].record(loop.time() - start, ok=False)
+                breaker.record(ok=False)
+                raise
+            except BaseException:
+                # A cancelled probe says nothing about the host; let the next request probe
+                if probe:
+                    breaker.probing = False
+                raise
+            host['limiter'].record(loop.time() - start, ok=True)
+            breaker.record(ok=True)
+
+    def stats(self):
+        return {host: {'rate': state['limiter'].rate, 'latency': state['limiter'].latency,
+                       'breaker': state['breaker'].state, 'breaker_trips': state['breaker'].trips}
+                for host, state in self._hosts.items()}
+
+    def log_summary(self):
+        """Log where each host's adaptive rate and breaker ended up and add them to the run metrics."""
+        stats = self.stats()
+        for host, state in stats.items():
+            rate = f"{state['rate']:.2f} requests/sec" if state['rate'] else "unlimited rate"
+            latency = f"{state['latency']:.2f}s" if state['latency'] is not None else "n/a"
+            logger.info(f"Host {host}: {rate}, average latency {latency}, breaker {state['breaker']} "
+                        f"({state['breaker_trips']} trips)")
+        logger.info(f"{self.retries} page loads retried")
+        METRICS.detail('hosts', stats)
@@ -0,0 +1,205 @@
+# Shared crawl frontier for distributed runs: province x page tasks leased from a SQLite queue
+
+import json
+import logging
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from records import CompanyRecord
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_PATH = 'crawl_queue.sqlite'
+LEASE_SECONDS = 300          # a leased page goes back to the queue if not completed within this time
+MAX_ATTEMPTS = 5             # leases per page before it is given up as failed
+WALK_PAGE = 0                # task number of a listing whose page URLs can't be planned (walked as a whole)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    url TEXT PRIMARY KEY,
+    province TEXT NOT NULL,
+    pattern_json TEXT,
+    last_page INTEGER NOT NULL,
+    planned_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    url TEXT NOT NULL,
+    page_number INTEGER NOT NULL,
+    page_url TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    lease_owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    rows_json TEXT,
+    completed_by TEXT,
+    completed_at TEXT,
+    PRIMARY KEY (url, page_number)
+);
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, lease_expires);
+"""
+
+
+class WorkQueue:
+    """Province x page frontier shared by a coordinator and any number of workers.
+
+    The coordinator plans each listing (its page URL pattern and last known page) and
+    queues one task per page. Workers lease tasks for `lease_seconds`; a lease that runs
+    out (crashed or stuck worker) makes the page available again. Completing a page is
+    idempotent: the first result committed for a page wins, later ones are ignored.
+    Every write is its own short transaction, so workers in other processes (or on other
+    machines sharing the file) only wait for each other briefly.
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH, timeout=60):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can't lease the same page
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        self.conn.execute('COMMIT')
+
+    def plan_listing(self, url, province, pattern, last_page, page_urls, done_pages=None):
+        """Register a listing and queue its pages; pages in `done_pages` ({page: records}) are stored as done.
+
+        Planning an already planned listing only adds pages it doesn't have yet.
+        """
+        now = datetime.now().isoformat()
+        with self._transaction():
+            self.conn.execute(
+                'INSERT INTO listings (url, province, pattern_json, last_page, planned_at) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (url) DO UPDATE SET last_page = MAX(last_page, excluded.last_page)',
+                (url, province, json.dumps(pattern) if pattern else None, last_page, now))
+            self.conn.executemany('INSERT OR IGNORE INTO tasks (url, page_number, page_url) VALUES (?, ?, ?)',
+                                  ((url, page_number, target) for page_number, target in page_urls))
+            for page_number, records in (done_pages or {}).items():
+                self.conn.execute(
+                    "UPDATE tasks SET state = 'done', rows_json = ?, completed_by = 'coordinator', completed_at = ? "
+                    "WHERE url = ? AND page_number = ? AND state != 'done'",
+                    (rows_json(records), now, url, page_number))
+
+    def extend_listing(self, url, last_page, page_urls):
+        """Queue pages discovered past the listing's last known page."""
+        with self._transaction():
+            self.conn.execute('UPDATE listings SET last_page = MAX(last_page, ?) WHERE url = ?', (last_page, url))
+            self.conn.executemany('INSERT OR IGNORE INTO tasks (url, page_number, page_url) VALUES (?, ?, ?)',
+                                  ((url, page_number, target) for page_number, target in page_urls))
+
+    def listing(self, url):
+        row = self.conn.execute('SELECT province, pattern_json, last_page FROM listings WHERE url = ?',
+                                (url,)).fetchone()
+        if not row:
+            return None
+        return {'url': url, 'province': row[0], 'pattern': json.loads(row[1]) if row[1] else None,
+                'last_page': row[2]}
+
+    def lease(self, worker_id, count=1, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        """Lease up to `count` pending (or expired) tasks, lowest page numbers first.
+
+        Pages whose lease keeps expiring (they crash their worker) are failed after `max_attempts`.
+        """
+        now = time.time()
+        with self._transaction():
+            abandoned = self.conn.execute(
+                "UPDATE tasks SET state = 'failed', error = 'lease expired' "
+                "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?", (now, max_attempts)).rowcount
+            if abandoned:
+                logger.warning(f"{abandoned} pages failed after {max_attempts} expired leases")
+            tasks = self.conn.execute(
+                "SELECT t.url, t.page_number, t.page_url, l.province FROM tasks t JOIN listings l ON l.url = t.url "
+                "WHERE t.state = 'pending' OR (t.state = 'leased' AND t.lease_expires < ?) "
+                "ORDER BY t.page_number, t.url LIMIT ?", (now, count)).fetchall()
+            self.conn.executemany(
+                "UPDATE tasks SET state = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE url = ? AND page_number = ?",
+                ((worker_id, now + lease_seconds, url, page_number) for url, page_number, _, _ in tasks))
+        return [{'url': url, 'page_number': page_number, 'page_url': target, 'province': province}
+                for url, page_number, target, province in tasks]
+
+    def renew(self, worker_id, task, lease_seconds=LEASE_SECONDS):
+        """Extend a lease still held by `worker_id`; False if it expired and was taken over."""
+        with self._transaction():
+            cursor = self.conn.execute(
+                "UPDATE tasks SET lease_expires = ? WHERE url = ? AND page_number = ? AND state = 'leased' "
+                "AND lease_owner = ?", (time.time() + lease_seconds, task['url'], task['page_number'], worker_id))
+        return cursor.rowcount == 1
+
+    def complete(self, worker_id, task, records):
+        """Store a page's records; returns False if another worker already completed it."""
+        with self._transaction():
+            cursor = self.conn.execute(
+                "UPDATE tasks SET state = 'done', rows_json = ?, completed_by = ?, completed_at = ?, error = NULL "
+                "WHERE url = ? AND page_number = ? AND state != 'done'",
+                (rows_json(records), worker_id, datetime.now().isoformat(), task['url'], task['page_number']))
+        return cursor.rowcount == 1
+
+    def fail(self, worker_id, task, error, max_attempts=MAX_ATTEMPTS):
+        """Give a page back to the queue, or mark it failed after `max_attempts` leases."""
+        with self._transaction():
+            self.conn.execute(
+                "UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "lease_owner = NULL, lease_expires = NULL, error = ? "
+                "WHERE url = ? AND page_number = ? AND state = 'leased' AND lease_owner = ?",
+                (max_attempts, str(error), task['url'], task['page_number'], worker_id))
+
+    def requeue_failed(self):
+        """Put failed pages back in the queue with fresh attempts (after fixing whatever made them fail)."""
+        with self._transaction():
+            cursor = self.conn.execute("UPDATE tasks SET state = 'pending', attempts = 0 WHERE state = 'failed'")
+        return cursor.rowcount
+
+    def progress(self):
+        """{state: task count}, with expired leases counted as pending."""
+        counts = {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0}
+        cursor = self.conn.execute(
+            "SELECT CASE WHEN state = 'leased' AND lease_expires < ? THEN 'pending' ELSE state END, COUNT(*) "
+            "FROM tasks GROUP BY 1", (time.time(),))
+        for state, count in cursor:
+            counts[state] = count
+        return counts
+
+    def is_finished(self):
+        progress = self.progress()
+        return not progress['pending'] and not progress['leased']
+
+    def summary(self):
+        cursor = self.conn.execute(
+            "SELECT l.province, l.last_page, SUM(t.state = 'done'), SUM(t.state = 'failed'), COUNT(t.page_number) "
+            "FROM listings l LEFT JOIN tasks t ON t.url = l.url GROUP BY l.url ORDER BY l.province")
+        return [{'province': province, 'last_page': last_page, 'done': done or 0, 'failed': failed or 0,
+                 'pages': pages} for province, last_page, done, failed, pages in cursor]
+
+    def listings(self):
+        cursor = self.conn.execute('SELECT url, province FROM listings ORDER BY rowid')
+        return [{'url': url, 'province': province} for url, province in cursor]
+
+    def completed_pages(self, url):
+        """Yield (page_number, records) of a listing's finished pages in page order."""
+        cursor = self.conn.execute(
+            "SELECT page_number, rows_json FROM tasks WHERE url = ? AND state = 'done' ORDER BY page_number", (url,))
+        for page_number, stored in cursor:
+            yield page_number, [CompanyRecord.from_row(row) for row in json.loads(stored)]
+
+    def failed_pages(self, url):
+        cursor = self.conn.execute("SELECT page_number FROM tasks WHERE url = ? AND state != 'done' "
+                                   "ORDER BY page_number", (url,))
+        return [page_number for page_number, in cursor]
+
+    def close(self):
+        self.conn.close()
+
+
+def rows_json(records):
+    return json.dumps([record.to_row() for record in records], ensure_ascii=False)